@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from app.services.loop_watchdog import loop_watchdog
+
+router = APIRouter(prefix="/api/diagnostics", tags=["diagnostics"])
+
+
+@router.get("/loop")
+async def get_loop_stats():
+    """获取事件循环延迟百分位数，以及最近几次卡顿时循环线程的调用栈"""
+    return loop_watchdog.stats()
+
+
+@router.post("/loop/reset")
+async def reset_loop_stats():
+    """清空已有样本，便于对比调整前后的延迟"""
+    loop_watchdog.reset()
+    return {"status": "reset"}
@@ -0,0 +1,111 @@
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.models import Message, ScriptTask
+from app.models.serializers import (
+    MESSAGE_COLUMNS, TASK_COLUMNS, author_cache, message_rows_to_dicts, task_row_to_dict, dump_json
+)
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+
+def _ndjson(records: list[dict]) -> bytes:
+    return b"".join(dump_json(record) + b"\n" for record in records)
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """边生成边压缩，输出标准 gzip 流"""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_response(chunks: AsyncIterator[bytes], filename: str, compress: Optional[str]) -> StreamingResponse:
+    if compress == "gzip":
+        return StreamingResponse(
+            _gzip(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson.gz"'}
+        )
+    return StreamingResponse(
+        chunks,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'}
+    )
+
+
+async def _stream_messages(room_id: str, since: Optional[datetime], until: Optional[datetime]):
+    query = select(*MESSAGE_COLUMNS).where(Message.room_id == room_id)
+    if since is not None:
+        query = query.where(Message.created_at >= since)
+    if until is not None:
+        query = query.where(Message.created_at < until)
+    query = query.order_by(Message.id).execution_options(yield_per=settings.export_chunk_size)
+
+    # 响应开始发送前依赖注入的会话就已关闭，流式导出自己管理会话
+    async with async_session() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            authors = await author_cache.get_many(db, {row.author_id for row in rows})
+            yield _ndjson(message_rows_to_dicts(rows, authors))
+
+
+async def _stream_tasks(
+    script_id: Optional[int],
+    status: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime]
+):
+    query = select(*TASK_COLUMNS)
+    if script_id is not None:
+        query = query.where(ScriptTask.script_id == script_id)
+    if status is not None:
+        query = query.where(ScriptTask.status == status)
+    if since is not None:
+        query = query.where(ScriptTask.started_at >= since)
+    if until is not None:
+        query = query.where(ScriptTask.started_at < until)
+    query = query.order_by(ScriptTask.id).execution_options(yield_per=settings.export_chunk_size)
+
+    async with async_session() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield _ndjson([task_row_to_dict(row) for row in rows])
+
+
+@router.get("/rooms/{room_id}")
+async def export_room(
+    room_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    compress: Optional[Literal["gzip"]] = None
+):
+    """以 NDJSON 流式导出房间消息，每行一条，格式与历史消息接口一致
+
+    通过服务端游标分批读取，内存占用与导出总量无关；since/until 按消息创建时间过滤。
+    """
+    return _export_response(
+        _stream_messages(room_id, since, until), f"room-{room_id}", compress
+    )
+
+
+@router.get("/tasks")
+async def export_tasks(
+    script_id: Optional[int] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    compress: Optional[Literal["gzip"]] = None
+):
+    """以 NDJSON 流式导出脚本执行记录，since/until 按任务开始时间过滤"""
+    return _export_response(
+        _stream_tasks(script_id, status, since, until), "tasks", compress
+    )
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from app.services.rate_limiter import rate_limiter
+
+router = APIRouter(prefix="/api/limits", tags=["limits"])
+
+
+@router.get("/stats")
+async def get_limit_stats():
+    """获取当前连接数与限流拒绝计数"""
+    return rate_limiter.stats()
@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from collections import defaultdict
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import and_, insert, or_, select
 from typing import List
 from datetime import datetime
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.models import User, Message
-from app.models.schemas import MessageCreate, MessageResponse
+from app.models.schemas import MessageCreate, MessageResponse, MessageBatchResponse
+from app.api.routes.websocket import manager, message_event
+from app.services.room_sequence import room_sequencer
+from app.models.serializers import (
+    MESSAGE_COLUMNS, author_cache, message_rows_to_dicts, dump_json
+)
 
 router = APIRouter(prefix="/api/messages", tags=["messages"])
 
+_message_list = TypeAdapter(list[MessageCreate])
+
 
 @router.get("", response_model=List[MessageResponse])
 async def get_messages(
@@ -17,16 +27,20 @@ async def get_messages(
     limit: int = 50,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取聊天消息"""
+    """获取聊天消息（按列查询并直接输出 JSON，跳过 response_model 校验）"""
     result = await db.execute(
-        select(Message)
-        .options(selectinload(Message.author))
+        select(*MESSAGE_COLUMNS)
         .where(Message.room_id == room_id)
         .order_by(Message.created_at.desc())
         .limit(limit)
     )
-    messages = list(result.scalars().all())
-    return list(reversed(messages))
+    rows = result.all()
+    rows.reverse()
+    authors = await author_cache.get_many(db, {row.author_id for row in rows})
+    return Response(
+        content=dump_json(message_rows_to_dicts(rows, authors)),
+        media_type="application/json"
+    )
 
 
 @router.post("", response_model=MessageResponse)
@@ -50,5 +64,93 @@ async def create_message(
 
     db.add(message)
     await db.commit()
-    await db.refresh(message)
+    await db.refresh(message, ["author"])
+
+    # 通知在线客户端，同时进入断线补发缓冲
+    await manager.broadcast(message_event(message, message.author), message.room_id)
     return message
+
+
+def _insert_batch(session, rows: list[dict]) -> dict[str, tuple[int, int]]:
+    """分配房间序号后一次 executemany 插入，返回每个房间本批的序号范围
+
+    SQLite 不保证 INSERT ... RETURNING 的行序，ORM 逐对象 flush 只能一条条执行；
+    这里改为不带 RETURNING 的批量插入，序号也就不能交给 ORM 事件，需要在这里分配。
+    """
+    connection = session.connection()
+    ranges: dict[str, tuple[int, int]] = {}
+    for row in rows:
+        room_id = row["room_id"]
+        row["seq"] = room_sequencer.next(connection, room_id)
+        first = ranges[room_id][0] if room_id in ranges else row["seq"]
+        ranges[room_id] = (first, row["seq"])
+    session.execute(insert(Message), rows)
+    return ranges
+
+
+def _parse_batch(body: bytes, content_type: str) -> list[MessageCreate]:
+    """解析批量请求体：JSON 数组，或每行一条消息的 NDJSON"""
+    try:
+        if "ndjson" in content_type:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+        return _message_list.validate_python(items)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+
+@router.post("/batch", response_model=MessageBatchResponse)
+async def create_messages_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """批量创建消息，供机器人和集成使用
+
+    请求体为消息数组（application/json）或 NDJSON（application/x-ndjson），可以跨房间。
+    所有消息在一个事务中插入，按房间合并成 message_batch 事件广播，返回的 id 与请求顺序一致。
+    """
+    items = _parse_batch(await request.body(), request.headers.get("content-type", ""))
+    if not items:
+        return MessageBatchResponse(ids=[])
+    if len(items) > settings.message_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.message_batch_max_size} messages per batch"
+        )
+
+    # 使用固定用户 ID=1 (username="user")，与单条接口一致
+    now = datetime.utcnow()
+    rows = [
+        {
+            "content": item.content,
+            "author_id": 1,
+            "room_id": item.room_id or "general",
+            "is_command": 1 if item.content.startswith("/") else item.is_command,
+            "created_at": now,
+        }
+        for item in items
+    ]
+    ranges = await db.run_sync(_insert_batch, rows)
+
+    # (room_id, seq) 在房间内唯一，用它取回分配的 id 和完整的消息行
+    result = await db.execute(
+        select(*MESSAGE_COLUMNS).where(or_(*(
+            and_(Message.room_id == room_id, Message.seq.between(first, last))
+            for room_id, (first, last) in ranges.items()
+        )))
+    )
+    inserted = {(row.room_id, row.seq): row for row in result.all()}
+    await db.commit()
+
+    ordered = [inserted[(row["room_id"], row["seq"])] for row in rows]
+    authors = await author_cache.get_many(db, {1})
+    by_room: dict[str, list[dict]] = defaultdict(list)
+    for data in message_rows_to_dicts(ordered, authors):
+        by_room[data["room_id"]].append({"type": "message", "data": data})
+    for room_id, events in by_room.items():
+        await manager.broadcast_batch(events, room_id)
+
+    return MessageBatchResponse(ids=[row.id for row in ordered])
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from app.models.schemas import PresenceResponse
+from app.services.presence_service import presence_service
+
+router = APIRouter(prefix="/api/presence", tags=["presence"])
+
+
+@router.get("/{room_id}", response_model=PresenceResponse)
+async def get_presence(room_id: str):
+    """获取房间当前在线用户快照"""
+    users = presence_service.snapshot(room_id)
+    return PresenceResponse(
+        room_id=room_id,
+        online_count=len(users),
+        users=users
+    )
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app.core.database import get_db
+from app.models.models import Script
+from app.models.schemas import ScheduleCreate, ScheduleResponse
+from app.services.cron import CronError
+from app.services.scheduler import scheduler
+
+router = APIRouter(prefix="/api/schedules", tags=["schedules"])
+
+
+@router.get("", response_model=List[ScheduleResponse])
+async def list_schedules(db: AsyncSession = Depends(get_db)):
+    """获取所有定时任务"""
+    return await scheduler.get_all_schedules(db)
+
+
+@router.post("", response_model=ScheduleResponse)
+async def create_schedule(
+    schedule: ScheduleCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """创建定时任务"""
+    if not await db.get(Script, schedule.script_id):
+        raise HTTPException(status_code=404, detail="Script not found")
+    # 使用固定用户 ID=1 (username="user")
+    try:
+        return await scheduler.create_schedule(
+            db=db,
+            script_id=schedule.script_id,
+            user_id=1,
+            room_id=schedule.room_id,
+            cron=schedule.cron,
+            interval_seconds=schedule.interval_seconds,
+            jitter_seconds=schedule.jitter_seconds,
+            catchup_policy=schedule.catchup_policy,
+            allow_overlap=schedule.allow_overlap
+        )
+    except (CronError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{schedule_id}")
+async def delete_schedule(
+    schedule_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """停用定时任务"""
+    if not await scheduler.delete_schedule(db, schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"status": "deleted"}
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from sqlalchemy import select
+from typing import List, Optional
 from app.core.database import get_db
-from app.models.schemas import ScriptResponse, ScriptTaskResponse
+from app.models.schemas import ScriptResponse, ScriptTaskResponse, ScriptStats, TaskPurgeResponse
+from app.models.models import ScriptTask
+from app.models.serializers import (
+    TASK_COLUMNS, TASK_COLUMNS_WITHOUT_OUTPUT, task_row_to_dict, dump_json
+)
 from app.services.script_service import script_service
+from app.services.blob_store import blob_store
+from app.services.workflow_service import workflow_service
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/scripts", tags=["scripts"])
@@ -18,12 +26,13 @@ class CommandInfo(BaseModel):
 BUILTIN_COMMANDS = [
     CommandInfo(name="/list", description="List all available scripts"),
     CommandInfo(name="/status", description="Check task status: /status <task_id>"),
+    CommandInfo(name="/cancel", description="Cancel a running task: /cancel <task_id>"),
 ]
 
 
 @router.get("/commands", response_model=List[CommandInfo])
 async def list_commands(db: AsyncSession = Depends(get_db)):
-    """获取所有可用命令（内置命令 + 脚本命令）"""
+    """获取所有可用命令（内置命令 + 脚本命令 + 工作流命令）"""
     commands = BUILTIN_COMMANDS.copy()
     scripts = await script_service.get_all_scripts(db)
     for script in scripts:
@@ -34,6 +43,13 @@ async def list_commands(db: AsyncSession = Depends(get_db)):
                     description=script.description or f"Run {script.name} script"
                 )
             )
+    for workflow in await workflow_service.get_all_workflows(db):
+        commands.append(
+            CommandInfo(
+                name=workflow.command_pattern,
+                description=workflow.description or f"Run {workflow.name} workflow"
+            )
+        )
     return commands
 
 
@@ -50,26 +66,118 @@ async def register_script(
     path: str,
     description: str = None,
     command_pattern: str = None,
+    executor: str = "subprocess",
+    args_schema: str = None,
+    rlimit_cpu_seconds: int = None,
+    rlimit_memory_mb: int = None,
+    rlimit_nofile: int = None,
+    idempotent: int = 0,
     db: AsyncSession = Depends(get_db)
 ):
-    """注册新脚本"""
-    script = await script_service.register_script(
-        db=db,
-        name=name,
-        path=path,
-        description=description,
-        command_pattern=command_pattern
-    )
+    """注册新脚本（executor=python_pool 时在预热的解释器池中执行）"""
+    try:
+        script = await script_service.register_script(
+            db=db,
+            name=name,
+            path=path,
+            description=description,
+            command_pattern=command_pattern,
+            executor=executor,
+            args_schema=args_schema,
+            rlimit_cpu_seconds=rlimit_cpu_seconds,
+            rlimit_memory_mb=rlimit_memory_mb,
+            rlimit_nofile=rlimit_nofile,
+            idempotent=idempotent
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return script
 
 
+@router.get("/stats", response_model=List[ScriptStats])
+async def get_script_stats(
+    script_id: int = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """按脚本统计执行次数、运行时间分位数和 CPU 时间"""
+    return await script_service.get_script_stats(db, script_id)
+
+
 @router.get("/tasks/{task_id}", response_model=ScriptTaskResponse)
 async def get_task_status(
     task_id: int,
     db: AsyncSession = Depends(get_db)
 ):
     """获取脚本任务状态"""
-    task = await script_service.get_task(db, task_id)
+    result = await db.execute(select(*TASK_COLUMNS).where(ScriptTask.id == task_id))
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return Response(content=dump_json(task_row_to_dict(row)), media_type="application/json")
+
+
+@router.get("/tasks", response_model=List[ScriptTaskResponse])
+async def list_tasks(
+    script_id: int = None,
+    limit: int = 50,
+    include_output: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取脚本任务历史（最新的在前）
+
+    include_output=false 时只返回 output_hash，输出内容通过 /outputs/{hash} 按需获取。
+    """
+    columns = TASK_COLUMNS if include_output else TASK_COLUMNS_WITHOUT_OUTPUT
+    query = select(*columns).order_by(ScriptTask.id.desc()).limit(limit)
+    if script_id is not None:
+        query = query.where(ScriptTask.script_id == script_id)
+    result = await db.execute(query)
+    return Response(
+        content=dump_json([task_row_to_dict(row) for row in result.all()]),
+        media_type="application/json"
+    )
+
+
+@router.delete("/tasks", response_model=TaskPurgeResponse)
+async def purge_tasks(
+    before: datetime,
+    script_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """清理 before 之前结束的任务，并回收不再被引用的输出"""
+    return await script_service.purge_tasks(db, before, script_id)
+
+
+@router.get("/outputs/stats")
+async def get_output_stats(db: AsyncSession = Depends(get_db)):
+    """输出存储的 blob 数量、占用字节数和引用数"""
+    return await blob_store.stats(db)
+
+
+@router.get("/outputs/{output_hash}")
+async def get_output(
+    output_hash: str,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """按哈希获取脚本输出；内容不可变，客户端可以永久缓存"""
+    etag = f'"{output_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    blob = await blob_store.get(db, output_hash)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Output not found")
+    return Response(content=blob.content, media_type="text/plain; charset=utf-8", headers=headers)
+
+
+@router.post("/tasks/{task_id}/cancel", response_model=ScriptTaskResponse)
+async def cancel_task(
+    task_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """取消正在运行的脚本任务"""
+    task = await script_service.cancel_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
@@ -4,49 +4,460 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime
-from app.core.database import get_db
-from app.models.models import User, Message, ScriptTask
+from app.core.database import get_db, async_session
+from app.core.config import settings
+from app.models.models import User, Message, Script, ScriptTask, Workflow
 from app.services.script_service import script_service
+from app.services.workflow_service import workflow_service
+from app.services.presence_service import presence_service
+from app.services.rate_limiter import rate_limiter
+from app.services.room_sequence import replay_buffer
+from app.models.serializers import (
+    MESSAGE_COLUMNS, author_cache, message_rows_to_dicts, output_ref
+)
 
 router = APIRouter()
 
+# 后台发布结果的任务：事件循环只保留弱引用，这里持有引用直到任务结束
+background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, list[WebSocket]] = {}
+        # room_id -> 订阅该房间的连接（dict 保持加入顺序，增删都是 O(1)）
+        self.active_connections: dict[str, dict[WebSocket, None]] = {}
+        # 连接 -> 已订阅的房间，房间级的清理只以这里为准
+        self.subscriptions: dict[WebSocket, set[str]] = {}
+        # 连接 -> 在线状态中展示的用户
+        self.users: dict[WebSocket, dict] = {}
+        # 发送失败的连接，等它的接收循环退出后统一清理
+        self.dead: set[WebSocket] = set()
 
-    async def connect(self, websocket: WebSocket, room_id: str):
+    async def connect(self, websocket: WebSocket, user: User, room_id: str | None = None):
         await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
-        return len(self.active_connections[room_id]) - 1
+        self.subscriptions[websocket] = set()
+        self.users[websocket] = presence_user(user)
+        if room_id is not None:
+            self.subscribe(websocket, room_id)
+
+    def subscribe(self, websocket: WebSocket, room_id: str) -> bool:
+        """订阅房间并记录上线，已订阅时返回 False
+
+        房间名额由调用方事先通过 rate_limiter.join_room 占用，取消订阅时在这里归还。
+        """
+        rooms = self.subscriptions[websocket]
+        if room_id in rooms:
+            return False
+        rooms.add(room_id)
+        self.active_connections.setdefault(room_id, {})[websocket] = None
+        # 短时间内的上下线合并为一次 presence_delta 广播
+        presence_service.join(room_id, self.users[websocket])
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, room_id: str) -> bool:
+        """取消订阅，记录下线并归还房间名额；未订阅时返回 False"""
+        rooms = self.subscriptions.get(websocket)
+        if not rooms or room_id not in rooms:
+            return False
+        rooms.discard(room_id)
+        connections = self.active_connections.get(room_id)
+        if connections is not None:
+            connections.pop(websocket, None)
+            if not connections:
+                del self.active_connections[room_id]
+        presence_service.leave(room_id, self.users[websocket]["id"])
+        rate_limiter.leave_room(room_id)
+        return True
 
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        if room_id in self.active_connections:
-            self.active_connections[room_id].remove(websocket)
+    def disconnect(self, websocket: WebSocket):
+        """移除连接并清理它订阅的全部房间"""
+        for room_id in list(self.subscriptions.get(websocket, ())):
+            self.unsubscribe(websocket, room_id)
+        self.subscriptions.pop(websocket, None)
+        self.users.pop(websocket, None)
+        self.dead.discard(websocket)
 
     async def broadcast(self, message: dict, room_id: str):
-        if room_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[room_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    disconnected.append(connection)
-            for conn in disconnected:
-                self.active_connections[room_id].remove(conn)
+        """向房间的订阅者广播；事件带上 room_id，只编码一次"""
+        if message.get("type") == "message" and message["data"].get("seq") is not None:
+            replay_buffer.record(room_id, message["data"]["seq"], message)
+        await self._send(json.dumps({**message, "room_id": room_id}), room_id)
+
+    async def broadcast_batch(self, events: list[dict], room_id: str):
+        """把同一房间的多条消息事件合并成一帧 message_batch 广播
+
+        补发缓冲区仍按单条消息记录，重连补发时与普通消息没有区别。
+        """
+        for event in events:
+            replay_buffer.record(room_id, event["data"]["seq"], event)
+        await self._send(json.dumps({
+            "type": "message_batch",
+            "room_id": room_id,
+            "data": [event["data"] for event in events]
+        }), room_id)
+
+    async def _send(self, text: str, room_id: str):
+        connections = self.active_connections.get(room_id)
+        if not connections:
+            return
+        for connection in list(connections):
+            if connection in self.dead:
+                continue
+            try:
+                await connection.send_text(text)
+            except Exception:
+                # 只标记，订阅和名额由连接自己的 finally 通过 disconnect 一并清理
+                self.dead.add(connection)
 
 
 manager = ConnectionManager()
 
 
-@router.websocket("/ws/{room_id}")
-async def websocket_endpoint(
+def message_event(message: Message, user: User | None) -> dict:
+    """构造消息广播事件"""
+    return {
+        "type": "message",
+        "data": {
+            "id": message.id,
+            "content": message.content,
+            "is_command": message.is_command,
+            "author_id": message.author_id,
+            "room_id": message.room_id,
+            "command_result": message.command_result,
+            "error_message": message.error_message,
+            "seq": message.seq,
+            "created_at": message.created_at.isoformat(),
+            "author": {
+                "id": user.id,
+                "username": user.username,
+                "nickname": user.nickname,
+            } if user else None
+        }
+    }
+
+
+# 内置控制命令，不启动任何任务
+CONTROL_COMMANDS = ("/list", "/status", "/cancel")
+
+
+async def publish_script_result(
+    message_id: int,
+    user: User,
+    script_name: str,
+    task_id: int
+):
+    """后台等待任务结束，把结果写回命令消息并广播
+
+    不阻塞连接的接收循环，同一连接在任务运行期间仍可发送 /cancel 等命令。
+    """
+    async with async_session() as db:
+        task = await script_service.wait_task(db, task_id)
+        message = await db.get(Message, message_id)
+        if not task or not message:
+            return
+        message.command_result = json.dumps({
+            "type": "script_completed",
+            "task_id": task.id,
+            "script": script_name,
+            "status": task.status,
+            "exit_code": task.exit_code,
+            **output_ref(task.output, task.output_hash),
+            "error": task.error
+        })
+        await db.commit()
+        await db.refresh(message)
+    # 作为普通消息广播，前端会更新消息位置
+    await manager.broadcast(message_event(message, user), message.room_id)
+
+
+async def run_fanout(
+    message_id: int,
+    user: User,
+    script: Script,
+    arg_sets: list[list[str]]
+):
+    """扇出执行：所有结果汇总在同一条消息里，按间隔增量更新"""
+    async with async_session() as db:
+        message = await db.get(Message, message_id)
+        await _run_fanout(db, message, user, script, arg_sets)
+
+
+async def _run_fanout(
+    db: AsyncSession,
+    message: Message,
+    user: User,
+    script: Script,
+    arg_sets: list[list[str]]
+):
+    results: list[dict | None] = [None] * len(arg_sets)
+    runner = asyncio.create_task(
+        script_service.execute_fanout(script, user.id, arg_sets, results)
+    )
+    published = -1
+    while True:
+        done, _ = await asyncio.wait({runner}, timeout=settings.fanout_update_interval)
+        finished = [r for r in results if r is not None]
+        if done or len(finished) != published:
+            published = len(finished)
+            message.command_result = json.dumps({
+                "type": "script_fanout",
+                "script": script.name,
+                "status": "running" if not done else "completed",
+                "total": len(arg_sets),
+                "finished": len(finished),
+                "failed": sum(1 for r in finished if r["status"] != "completed"),
+                "results": [
+                    r if r is not None else {"args": args, "status": "pending"}
+                    for r, args in zip(results, arg_sets)
+                ]
+            })
+            if done and runner.exception():
+                message.error_message = str(runner.exception())
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            await manager.broadcast(message_event(message, user), message.room_id)
+        if done:
+            return
+
+
+async def run_workflow(
+    message_id: int,
+    user: User,
+    workflow_id: int,
+    args: list[str]
+):
+    """执行工作流，步骤状态变化时原地更新同一条命令消息"""
+    async with async_session() as db:
+        message = await db.get(Message, message_id)
+        workflow = await db.get(Workflow, workflow_id)
+
+        async def publish(summary: dict):
+            message.command_result = json.dumps(summary)
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            await manager.broadcast(message_event(message, user), message.room_id)
+
+        try:
+            await workflow_service.run(workflow, user.id, args, publish)
+        except Exception as e:
+            message.error_message = str(e)
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            await manager.broadcast(message_event(message, user), message.room_id)
+
+
+async def handle_client_message(
+    db: AsyncSession,
     websocket: WebSocket,
+    connection_id: int,
+    user: User,
     room_id: str,
-    db: AsyncSession = Depends(get_db)
+    msg_content: str
 ):
+    """处理客户端在某个房间发送的一条消息或斜杠命令"""
+    # 限流：只有启动脚本/扇出/工作流的命令消耗命令令牌；
+    # /list、/status、/cancel 等内置控制命令按普通消息计，房间命令被限流时仍能取消任务
+    command = msg_content.strip().split()[0] if msg_content.startswith("/") else ""
+    kind = "command" if command and command not in CONTROL_COMMANDS else "message"
+    retry_after = rate_limiter.check(kind, connection_id, user.id, room_id)
+    if retry_after is not None:
+        await websocket.send_json({
+            "type": "error",
+            "room_id": room_id,
+            "data": {
+                "code": "rate_limited",
+                "message": f"Too many {kind}s, slow down",
+                "retry_after": round(retry_after, 2)
+            }
+        })
+        return
+
+    # 保存消息到数据库
+    message = Message(
+        content=msg_content,
+        author_id=user.id,
+        room_id=room_id,
+        is_command=int(msg_content.startswith("/")),
+        created_at=datetime.utcnow()
+    )
+    db.add(message)
+    await db.commit()
+    await db.refresh(message)
+
+    # 处理斜杠命令
+    if msg_content.startswith("/"):
+        parts = msg_content.strip().split()
+
+        # /list - 列出可用脚本
+        if parts[0] == "/list":
+            scripts = await script_service.get_all_scripts(db)
+            scripts_list = [
+                {
+                    "name": s.name,
+                    "description": s.description,
+                    "command": s.command_pattern
+                } for s in scripts
+            ]
+            workflows = await workflow_service.get_all_workflows(db)
+            scripts_list += [
+                {
+                    "name": w.name,
+                    "description": w.description,
+                    "command": w.command_pattern
+                } for w in workflows
+            ]
+            result_data = {
+                "type": "list_scripts",
+                "scripts": scripts_list
+            }
+            message.command_result = json.dumps(result_data)
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            # 作为普通消息广播，前端会更新消息位置
+            await manager.broadcast(message_event(message, user), room_id)
+            return
+
+        # /status <task_id> - 查看任务状态
+        elif parts[0] == "/status" and len(parts) > 1:
+            try:
+                task_id = int(parts[1])
+                task = await script_service.get_task(db, task_id)
+                if task:
+                    result_data = {
+                        "type": "task_status",
+                        "task": {
+                            "id": task.id,
+                            "status": task.status,
+                            "exit_code": task.exit_code,
+                            **output_ref(task.output, task.output_hash),
+                            "error": task.error
+                        }
+                    }
+                    message.command_result = json.dumps(result_data)
+                    db.add(message)
+                    await db.commit()
+                    await db.refresh(message)
+                    # 作为普通消息广播，前端会更新消息位置
+                    await manager.broadcast(message_event(message, user), room_id)
+                else:
+                    error_data = f"Task {task_id} not found"
+                    message.error_message = error_data
+                    db.add(message)
+                    await db.commit()
+                    await db.refresh(message)
+                    await manager.broadcast(message_event(message, user), room_id)
+            except ValueError:
+                error_data = "Invalid task ID"
+                message.error_message = error_data
+                db.add(message)
+                await db.commit()
+                await db.refresh(message)
+                await manager.broadcast(message_event(message, user), room_id)
+            return
+
+        # /cancel <task_id> - 取消任务
+        elif parts[0] == "/cancel" and len(parts) > 1:
+            try:
+                task_id = int(parts[1])
+            except ValueError:
+                message.error_message = "Invalid task ID"
+            else:
+                task = await script_service.cancel_task(db, task_id)
+                if not task:
+                    message.error_message = f"Task {task_id} not found"
+                else:
+                    message.command_result = json.dumps({
+                        "type": "task_status",
+                        "task": {
+                            "id": task.id,
+                            "status": task.status,
+                            "exit_code": task.exit_code,
+                            **output_ref(task.output, task.output_hash),
+                            "error": task.error
+                        }
+                    })
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            await manager.broadcast(message_event(message, user), room_id)
+            return
+
+        # 尝试匹配脚本命令
+        command_pattern = parts[0]
+        if command_pattern:
+            script = await script_service.get_script_by_pattern(db, command_pattern)
+            if script:
+                try:
+                    arg_sets = script_service.build_arg_sets(script, parts[1:])
+                except ValueError as e:
+                    message.error_message = str(e)
+                    db.add(message)
+                    await db.commit()
+                    await db.refresh(message)
+                    await manager.broadcast(message_event(message, user), room_id)
+                    return
+
+                if len(arg_sets) > 1:
+                    run_in_background(run_fanout(message.id, user, script, arg_sets))
+                    return
+
+                # 执行脚本
+                task = await script_service.execute_script(db, script, user.id, arg_sets[0])
+
+                # 先广播 script_started 状态
+                started_data = {
+                    "type": "script_started",
+                    "message": f"Script '{script.name}' started",
+                    "task_id": task.id,
+                    "script": script.name
+                }
+                message.command_result = json.dumps(started_data)
+                db.add(message)
+                await db.commit()
+                await db.refresh(message)
+                # 作为普通消息广播，前端会更新消息位置
+                await manager.broadcast(message_event(message, user), room_id)
+
+                # 执行完成后发送结果并保存
+                run_in_background(
+                    publish_script_result(message.id, user, script.name, task.id)
+                )
+                return
+
+            # 工作流命令：后台按依赖执行各步骤
+            workflow = await workflow_service.get_workflow_by_pattern(db, command_pattern)
+            if workflow:
+                # 结束本会话上的读事务，连接可能长时间空闲
+                await db.commit()
+                run_in_background(run_workflow(message.id, user, workflow.id, parts[1:]))
+                return
+
+        # 未知命令
+        error_data = f"Unknown command: {command_pattern}. Use /list to see available commands."
+        message.error_message = error_data
+        db.add(message)
+        await db.commit()
+        await db.refresh(message)
+        # 作为普通消息广播，前端会更新消息位置
+        await manager.broadcast(message_event(message, user), room_id)
+        return
+
+    # 广播普通消息（非命令）
+    await manager.broadcast(message_event(message, user), room_id)
+
+
+async def get_ws_user(db: AsyncSession) -> User:
     # 使用固定用户
     username = "user"
     result = await db.execute(select(User).where(User.username == username))
@@ -61,23 +472,91 @@ async def websocket_endpoint(
         db.add(user)
         await db.commit()
         await db.refresh(user)
+    return user
 
-    await manager.connect(websocket, room_id)
 
-    # 发送用户加入消息
-    await manager.broadcast({
-        "type": "user_join",
-        "data": {
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "nickname": user.nickname,
-            },
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    }, room_id)
+def presence_user(user: User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "nickname": user.nickname,
+    }
+
+
+async def replay_missed(
+    db: AsyncSession,
+    websocket: WebSocket,
+    room_id: str,
+    last_seq: int
+):
+    """补发 last_seq 之后的事件：优先用内存缓冲，覆盖不到时按 (room_id, seq) 索引查库
+
+    调用前连接已订阅房间，补发期间的新事件可能重复到达，客户端按消息 id 合并即可。
+    """
+    events = replay_buffer.since(room_id, last_seq)
+    truncated = False
+    if events is None:
+        result = await db.execute(
+            select(*MESSAGE_COLUMNS)
+            .where(Message.room_id == room_id, Message.seq > last_seq)
+            .order_by(Message.seq)
+            .limit(settings.replay_max_events + 1)
+        )
+        rows = result.all()
+        truncated = len(rows) > settings.replay_max_events
+        rows = rows[:settings.replay_max_events]
+        authors = await author_cache.get_many(db, {row.author_id for row in rows})
+        events = [
+            {"type": "message", "data": data}
+            for data in message_rows_to_dicts(rows, authors)
+        ]
+    for event in events:
+        await websocket.send_text(json.dumps({**event, "room_id": room_id}))
+    await websocket.send_json({
+        "type": "replay_done",
+        "room_id": room_id,
+        "count": len(events),
+        "truncated": truncated
+    })
+
+
+async def reject_connection(websocket: WebSocket):
+    """拒绝超出上限的连接：先完成握手再以 1013 关闭，客户端才能拿到关闭码并稍后重试"""
+    await websocket.accept()
+    await websocket.close(code=1013, reason="Too many connections")
+
+
+@router.websocket("/ws/{room_id}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    room_id: str,
+    last_seq: int | None = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # 连接准入：先于任何数据库访问，超出房间/进程连接上限时直接拒绝
+    if not rate_limiter.acquire_connection():
+        await reject_connection(websocket)
+        return
+    connection_id = id(websocket)
+    if not rate_limiter.join_room(room_id):
+        rate_limiter.release_connection(connection_id)
+        await reject_connection(websocket)
+        return
 
     try:
+        user = await get_ws_user(db)
+        await manager.connect(websocket, user, room_id)
+    except Exception:
+        # 还没交给 manager 管理，名额在这里归还
+        rate_limiter.leave_room(room_id)
+        rate_limiter.release_connection(connection_id)
+        raise
+
+    try:
+        # 重连时只补发错过的事件，之后进入实时推送
+        if last_seq is not None:
+            await replay_missed(db, websocket, room_id, last_seq)
+
         while True:
             data = await websocket.receive_json()
 
@@ -85,282 +564,83 @@ async def websocket_endpoint(
             msg_content = data.get("content", "")
             token = data.get("token")
 
-            # 保存消息到数据库
-            message = Message(
-                content=msg_content,
-                author_id=user.id,
-                room_id=room_id,
-                is_command=int(msg_content.startswith("/")),
-                created_at=datetime.utcnow()
-            )
-            db.add(message)
-            await db.commit()
-            await db.refresh(message)
+            await handle_client_message(db, websocket, connection_id, user, room_id, msg_content)
 
-            # 处理斜杠命令
-            if msg_content.startswith("/"):
-                parts = msg_content.strip().split()
-
-                # /list - 列出可用脚本
-                if parts[0] == "/list":
-                    scripts = await script_service.get_all_scripts(db)
-                    scripts_list = [
-                        {
-                            "name": s.name,
-                            "description": s.description,
-                            "command": s.command_pattern
-                        } for s in scripts
-                    ]
-                    result_data = {
-                        "type": "list_scripts",
-                        "scripts": scripts_list
-                    }
-                    message.command_result = json.dumps(result_data)
-                    db.add(message)
-                    await db.commit()
-                    await db.refresh(message)
-                    # 作为普通消息广播，前端会更新消息位置
-                    await manager.broadcast({
-                        "type": "message",
-                        "data": {
-                            "id": message.id,
-                            "content": message.content,
-                            "is_command": message.is_command,
-                            "author_id": message.author_id,
-                            "room_id": message.room_id,
-                            "command_result": message.command_result,
-                            "error_message": message.error_message,
-                            "created_at": message.created_at.isoformat(),
-                            "author": {
-                                "id": user.id,
-                                "username": user.username,
-                                "nickname": user.nickname,
-                            }
-                        }
-                    }, room_id)
-                    continue
-
-                # /status <task_id> - 查看任务状态
-                elif parts[0] == "/status" and len(parts) > 1:
-                    try:
-                        task_id = int(parts[1])
-                        task = await script_service.get_task(db, task_id)
-                        if task:
-                            result_data = {
-                                "type": "task_status",
-                                "task": {
-                                    "id": task.id,
-                                    "status": task.status,
-                                    "exit_code": task.exit_code,
-                                    "output": task.output,
-                                    "error": task.error
-                                }
-                            }
-                            message.command_result = json.dumps(result_data)
-                            db.add(message)
-                            await db.commit()
-                            await db.refresh(message)
-                            # 作为普通消息广播，前端会更新消息位置
-                            await manager.broadcast({
-                                "type": "message",
-                                "data": {
-                                    "id": message.id,
-                                    "content": message.content,
-                                    "is_command": message.is_command,
-                                    "author_id": message.author_id,
-                                    "room_id": message.room_id,
-                                    "command_result": message.command_result,
-                                    "error_message": message.error_message,
-                                    "created_at": message.created_at.isoformat(),
-                                    "author": {
-                                        "id": user.id,
-                                        "username": user.username,
-                                        "nickname": user.nickname,
-                                    }
-                                }
-                            }, room_id)
-                        else:
-                            error_data = f"Task {task_id} not found"
-                            message.error_message = error_data
-                            db.add(message)
-                            await db.commit()
-                            await db.refresh(message)
-                            await manager.broadcast({
-                                "type": "message",
-                                "data": {
-                                    "id": message.id,
-                                    "content": message.content,
-                                    "is_command": message.is_command,
-                                    "author_id": message.author_id,
-                                    "room_id": message.room_id,
-                                    "command_result": message.command_result,
-                                    "error_message": message.error_message,
-                                    "created_at": message.created_at.isoformat(),
-                                    "author": {
-                                        "id": user.id,
-                                        "username": user.username,
-                                        "nickname": user.nickname,
-                                    }
-                                }
-                            }, room_id)
-                    except ValueError:
-                        error_data = "Invalid task ID"
-                        message.error_message = error_data
-                        db.add(message)
-                        await db.commit()
-                        await db.refresh(message)
-                        await manager.broadcast({
-                            "type": "message",
-                            "data": {
-                                "id": message.id,
-                                "content": message.content,
-                                "is_command": message.is_command,
-                                "author_id": message.author_id,
-                                "room_id": message.room_id,
-                                "command_result": message.command_result,
-                                "error_message": message.error_message,
-                                "created_at": message.created_at.isoformat(),
-                                "author": {
-                                    "id": user.id,
-                                    "username": user.username,
-                                    "nickname": user.nickname,
-                                }
-                            }
-                        }, room_id)
-                    continue
-
-                # 尝试匹配脚本命令
-                command_pattern = msg_content.split()[0] if msg_content.split() else ""
-                if command_pattern:
-                    script = await script_service.get_script_by_pattern(db, command_pattern)
-                    if script:
-                        # 执行脚本
-                        task = await script_service.execute_script(db, script, user.id)
-
-                        # 先广播 script_started 状态
-                        started_data = {
-                            "type": "script_started",
-                            "message": f"Script '{script.name}' started",
-                            "task_id": task.id,
-                            "script": script.name
-                        }
-                        message.command_result = json.dumps(started_data)
-                        db.add(message)
-                        await db.commit()
-                        await db.refresh(message)
-                        # 作为普通消息广播，前端会更新消息位置
-                        await manager.broadcast({
-                            "type": "message",
-                            "data": {
-                                "id": message.id,
-                                "content": message.content,
-                                "is_command": message.is_command,
-                                "author_id": message.author_id,
-                                "room_id": message.room_id,
-                                "command_result": message.command_result,
-                                "error_message": message.error_message,
-                                "created_at": message.created_at.isoformat(),
-                                "author": {
-                                    "id": user.id,
-                                    "username": user.username,
-                                    "nickname": user.nickname,
-                                }
-                            }
-                        }, room_id)
-
-                        # 执行完成后发送结果并保存
-                        while task and task.status in ("pending", "running"):
-                            await asyncio.sleep(0.5)
-                            task = await script_service.get_task(db, task.id)
-
-                        if task:
-                            result_data = {
-                                "type": "script_completed",
-                                "task_id": task.id,
-                                "script": script.name,
-                                "status": task.status,
-                                "exit_code": task.exit_code,
-                                "output": task.output,
-                                "error": task.error
-                            }
-                            message.command_result = json.dumps(result_data)
-                            db.add(message)
-                            await db.commit()
-                            await db.refresh(message)
-                            # 作为普通消息广播，前端会更新消息位置
-                            await manager.broadcast({
-                                "type": "message",
-                                "data": {
-                                    "id": message.id,
-                                    "content": message.content,
-                                    "is_command": message.is_command,
-                                    "author_id": message.author_id,
-                                    "room_id": message.room_id,
-                                    "command_result": message.command_result,
-                                    "error_message": message.error_message,
-                                    "created_at": message.created_at.isoformat(),
-                                    "author": {
-                                        "id": user.id,
-                                        "username": user.username,
-                                        "nickname": user.nickname,
-                                    }
-                                }
-                            }, room_id)
-                        continue
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
+        rate_limiter.release_connection(connection_id)
 
-                # 未知命令
-                error_data = f"Unknown command: {command_pattern}. Use /list to see available commands."
-                message.error_message = error_data
-                db.add(message)
-                await db.commit()
-                await db.refresh(message)
-                # 作为普通消息广播，前端会更新消息位置
-                await manager.broadcast({
-                    "type": "message",
-                    "data": {
-                        "id": message.id,
-                        "content": message.content,
-                        "is_command": message.is_command,
-                        "author_id": message.author_id,
-                        "room_id": message.room_id,
-                        "command_result": message.command_result,
-                        "error_message": message.error_message,
-                        "created_at": message.created_at.isoformat(),
-                        "author": {
-                            "id": user.id,
-                            "username": user.username,
-                            "nickname": user.nickname,
-                        }
-                    }
-                }, room_id)
+
+@router.websocket("/ws")
+async def multiplexed_endpoint(
+    websocket: WebSocket,
+    db: AsyncSession = Depends(get_db)
+):
+    """一个连接订阅多个房间
+
+    控制帧：{"type": "subscribe" | "unsubscribe", "room_id": ..., "last_seq": 可选}
+    发送消息：{"type": "message", "room_id": ..., "content": ...}
+    服务端下发的事件都带 room_id。
+    """
+    if not rate_limiter.acquire_connection():
+        await reject_connection(websocket)
+        return
+    connection_id = id(websocket)
+
+    try:
+        user = await get_ws_user(db)
+        await manager.connect(websocket, user)
+    except Exception:
+        rate_limiter.release_connection(connection_id)
+        raise
+
+    async def send_error(code: str, message: str, room_id: str | None):
+        await websocket.send_json({
+            "type": "error",
+            "room_id": room_id,
+            "data": {"code": code, "message": message}
+        })
+
+    try:
+        while True:
+            data = await websocket.receive_json()
+
+            msg_type = data.get("type")
+            room_id = data.get("room_id")
+            if not room_id:
+                await send_error("invalid_frame", "room_id is required", None)
                 continue
+            subscribed = room_id in manager.subscriptions[websocket]
 
-            # 广播普通消息（非命令）
-            await manager.broadcast({
-                "type": "message",
-                "data": {
-                    "id": message.id,
-                    "content": message.content,
-                    "is_command": message.is_command,
-                    "author_id": message.author_id,
-                    "room_id": message.room_id,
-                    "command_result": message.command_result,
-                    "error_message": message.error_message,
-                    "created_at": message.created_at.isoformat(),
-                    "author": {
-                        "id": user.id,
-                        "username": user.username,
-                        "nickname": user.nickname,
-                    }
-                }
-            }, room_id)
+            if msg_type == "subscribe":
+                if not subscribed:
+                    if len(manager.subscriptions[websocket]) >= settings.max_subscriptions_per_connection:
+                        await send_error("too_many_subscriptions", "Subscription limit reached", room_id)
+                        continue
+                    if not rate_limiter.join_room(room_id):
+                        await send_error("room_full", "Too many connections in room", room_id)
+                        continue
+                    manager.subscribe(websocket, room_id)
+                await websocket.send_json({"type": "subscribed", "room_id": room_id})
+                if isinstance(data.get("last_seq"), int):
+                    await replay_missed(db, websocket, room_id, data["last_seq"])
+
+            elif msg_type == "unsubscribe":
+                manager.unsubscribe(websocket, room_id)
+                await websocket.send_json({"type": "unsubscribed", "room_id": room_id})
+
+            elif not subscribed:
+                await send_error("not_subscribed", f"Not subscribed to {room_id}", room_id)
+
+            else:
+                await handle_client_message(
+                    db, websocket, connection_id, user, room_id, data.get("content", "")
+                )
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, room_id)
-        await manager.broadcast({
-            "type": "user_leave",
-            "data": {
-                "user_id": user.id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        }, room_id)
+        pass
+    finally:
+        manager.disconnect(websocket)
+        rate_limiter.release_connection(connection_id)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app.core.database import get_db
+from app.models.schemas import WorkflowCreate, WorkflowResponse
+from app.services.workflow_service import workflow_service
+
+router = APIRouter(prefix="/api/workflows", tags=["workflows"])
+
+
+@router.get("", response_model=List[WorkflowResponse])
+async def list_workflows(db: AsyncSession = Depends(get_db)):
+    """获取所有工作流"""
+    return await workflow_service.get_all_workflows(db)
+
+
+@router.post("", response_model=WorkflowResponse)
+async def create_workflow(
+    workflow: WorkflowCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """创建工作流"""
+    try:
+        return await workflow_service.create_workflow(
+            db=db,
+            name=workflow.name,
+            steps=[step.model_dump() for step in workflow.steps],
+            description=workflow.description,
+            command_pattern=workflow.command_pattern
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{workflow_id}")
+async def delete_workflow(
+    workflow_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """停用工作流"""
+    if not await workflow_service.delete_workflow(db, workflow_id):
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return {"status": "deleted"}
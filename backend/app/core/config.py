@@ -9,6 +9,7 @@ class Settings(BaseSettings):
 
     # 数据库配置
     database_url: str = "sqlite+aiosqlite:///./chat_auto.db"
+    sql_echo: bool = False  # 输出 SQL 日志（同步写日志，会拖慢事件循环，仅调试时开启）
 
     # 脚本目录
     scripts_dir: Path = Path(__file__).resolve().parent.parent.parent.parent / "scripts"
@@ -19,6 +20,70 @@ class Settings(BaseSettings):
     # 安全配置
     max_script_runtime: int = 300  # 最大脚本执行时间(秒)
     allowed_exec_dir: str | None = None  # 限制脚本执行目录
+    task_kill_grace_seconds: float = 5  # 终止任务时 SIGTERM 到 SIGKILL 的宽限期(秒)
+    task_max_attempts: int = 3  # 幂等脚本重启后最多执行的次数
+
+    # Python 解释器池（executor=python_pool 的脚本使用，0 表示不启用）
+    python_pool_size: int = 2
+    python_pool_preload: list[str] = []  # worker 启动时预先导入的模块
+    python_pool_max_runs: int = 100  # 每个 worker 执行多少次后回收
+    python_pool_max_rss_growth_mb: int = 64  # 内存增长超过该值后回收
+    python_pool_acquire_timeout: float = 30  # 等待空闲 worker 的最长时间(秒)，超时后改用独立进程执行
+    python_pool_respawn_max_delay: float = 60  # 重启 worker 失败时重试间隔的上限(秒)
+
+    # 扇出执行配置
+    fanout_max_targets: int = 50  # 单条命令最多的参数组数
+    fanout_max_concurrency: int = 8  # 同时运行的子进程数
+    fanout_update_interval: float = 0.5  # 汇总消息的最小更新间隔(秒)
+
+    # 工作流配置
+    workflow_max_steps: int = 50  # 单个工作流最多的步骤数
+
+    # 定时任务配置
+    scheduler_max_catchup_runs: int = 10  # 停机后最多补跑的次数（run_all 策略）
+
+    # 批量写入配置
+    message_batch_max_size: int = 1000  # 单次批量写入的最大消息数
+
+    # 导出配置
+    export_chunk_size: int = 1000  # 流式导出时每批从游标读取的行数
+
+    # 事件中的脚本输出
+    event_output_inline_chars: int = 4096  # 更长的输出在事件中只带预览和哈希，客户端按哈希获取全文
+
+    # 事件循环监控配置
+    loop_watchdog_interval_ms: int = 100  # 采样间隔，0 表示不启用
+    loop_watchdog_threshold_ms: int = 200  # 循环卡住超过该时长时抓取调用栈
+    loop_watchdog_samples: int = 3000  # 用于计算百分位数的最近样本数
+    loop_watchdog_max_stalls: int = 20  # 保留的最近卡顿记录数
+    offload_threshold_bytes: int = 65536  # 超过该大小的输出在线程池中计算哈希（hashlib 计算时释放 GIL）
+
+    # 断线补发配置
+    replay_buffer_size: int = 500  # 每个房间在内存中保留的最近事件数
+    replay_max_events: int = 1000  # 单次补发的最大事件数，超出时提示客户端重新拉取历史
+
+    # 在线状态配置
+    presence_debounce_ms: int = 500  # 上下线事件合并窗口(毫秒)
+
+    # 限流配置（速率单位：次/秒，速率为 0 表示不限制）
+    message_rate_per_connection: float = 5
+    message_burst_per_connection: int = 10
+    message_rate_per_user: float = 10
+    message_burst_per_user: int = 20
+    message_rate_per_room: float = 50
+    message_burst_per_room: int = 100
+    command_rate_per_connection: float = 0.5
+    command_burst_per_connection: int = 3
+    command_rate_per_user: float = 1
+    command_burst_per_user: int = 5
+    command_rate_per_room: float = 2
+    command_burst_per_room: int = 10
+    rate_limit_sweep_interval_seconds: float = 60  # 回收空闲令牌桶的间隔
+
+    # 连接准入（0 表示不限制）
+    max_connections_per_room: int = 500
+    max_connections_total: int = 5000
+    max_subscriptions_per_connection: int = 50  # 多路复用连接最多订阅的房间数
 
     # JWT 密钥 (生产环境需使用环境变量)
     secret_key: str = "dev-secret-key-change-in-production"
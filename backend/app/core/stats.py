@@ -0,0 +1,9 @@
+from typing import Optional
+
+
+def percentile(values: list[float], percent: int) -> Optional[float]:
+    """最近秩百分位数，values 需已排序"""
+    if not values:
+        return None
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[index]
@@ -7,10 +7,20 @@ from app.core.config import settings
 from app.api.routes.scripts import router as scripts_router
 from app.api.routes.messages import router as messages_router
 from app.api.routes.websocket import router as websocket_router
+from app.api.routes.presence import router as presence_router
+from app.api.routes.limits import router as limits_router
+from app.api.routes.schedules import router as schedules_router
+from app.api.routes.exports import router as exports_router
+from app.api.routes.workflows import router as workflows_router
+from app.api.routes.diagnostics import router as diagnostics_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 最先启动事件循环监控，启动阶段的阻塞也能被记录
+    from app.services.loop_watchdog import loop_watchdog
+    await loop_watchdog.start()
+
     # 启动时初始化数据库
     await init_db()
 
@@ -44,8 +54,22 @@ async def lifespan(app: FastAPI):
                 command_pattern="/date"
             )
 
+    # 启动 Python 解释器池
+    from app.services.python_pool import python_pool
+    python_pool.start()
+
+    # 处理上次进程遗留的任务
+    await script_service.recover_tasks()
+
+    # 启动定时任务调度
+    from app.services.scheduler import scheduler
+    await scheduler.start()
+
     yield
     # 关闭时的清理工作
+    await scheduler.stop()
+    python_pool.shutdown()
+    await loop_watchdog.stop()
 
 
 app = FastAPI(
@@ -68,6 +92,12 @@ app.add_middleware(
 app.include_router(scripts_router)
 app.include_router(messages_router)
 app.include_router(websocket_router)
+app.include_router(presence_router)
+app.include_router(limits_router)
+app.include_router(schedules_router)
+app.include_router(exports_router)
+app.include_router(workflows_router)
+app.include_router(diagnostics_router)
 
 
 @app.get("/")
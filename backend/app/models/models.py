@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -27,10 +27,15 @@ class Message(Base):
     room_id = Column(String(50), default="general")
     command_result = Column(Text, nullable=True)  # 命令执行结果
     error_message = Column(Text, nullable=True)   # 命令执行错误
+    seq = Column(Integer)  # 房间内序号，每次插入或更新递增，用于断线补发
     created_at = Column(DateTime, default=datetime.utcnow)
 
     author = relationship("User", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_messages_room_seq", "room_id", "seq"),
+    )
+
 
 class Script(Base):
     __tablename__ = "scripts"
@@ -40,6 +45,25 @@ class Script(Base):
     description = Column(Text)
     path = Column(String(255), nullable=False)
     command_pattern = Column(String(100))  # 触发的斜杠命令，如 "/deploy"
+    executor = Column(String(20), default="subprocess")  # subprocess, python_pool
+    args_schema = Column(Text, nullable=True)  # 参数声明(JSON)
+    rlimit_cpu_seconds = Column(Integer, nullable=True)  # CPU 时间上限(秒)
+    rlimit_memory_mb = Column(Integer, nullable=True)  # 地址空间上限(MB)
+    rlimit_nofile = Column(Integer, nullable=True)  # 打开文件数上限
+    idempotent = Column(Integer, default=0)  # 可安全重跑，重启后自动重新排队
+    is_active = Column(Integer, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Workflow(Base):
+    """由多个脚本步骤组成的工作流，步骤之间按依赖关系构成 DAG"""
+    __tablename__ = "workflows"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False, index=True)
+    description = Column(Text)
+    command_pattern = Column(String(100))  # 触发的斜杠命令，如 "/release"
+    steps = Column(Text, nullable=False)  # 步骤定义(JSON 数组)
     is_active = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -50,12 +74,60 @@ class ScriptTask(Base):
     id = Column(Integer, primary_key=True, index=True)
     script_id = Column(Integer, ForeignKey("scripts.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    status = Column(String(20), default="pending")  # pending, running, completed, failed
+    args = Column(Text, nullable=True)  # 执行参数(JSON 数组)
+    status = Column(String(20), default="pending")  # pending, running, completed, failed, cancelled
+    attempts = Column(Integer, default=1)
     exit_code = Column(Integer)
-    output = Column(Text)
+    output_hash = Column(String(64), ForeignKey("output_blobs.hash"), index=True)  # 输出内容所在的 blob
+    output_text = Column("output", Text)  # 早期任务内联保存的输出
     error = Column(Text)
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
 
+    # 资源占用
+    cpu_user_seconds = Column(Float)
+    cpu_system_seconds = Column(Float)
+    io_read_blocks = Column(Integer)
+    io_write_blocks = Column(Integer)
+    wall_seconds = Column(Float)
+
     script = relationship("Script")
     user = relationship("User", back_populates="script_tasks")
+    output_blob = relationship("OutputBlob", lazy="joined")
+
+    @property
+    def output(self):
+        if self.output_blob is not None:
+            return self.output_blob.content
+        return self.output_text
+
+
+class OutputBlob(Base):
+    """按内容哈希去重保存的脚本输出，ref_count 为引用它的任务数"""
+    __tablename__ = "output_blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256
+    content = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Schedule(Base):
+    __tablename__ = "schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    script_id = Column(Integer, ForeignKey("scripts.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    room_id = Column(String(50), default="general")  # 结果发送到的房间
+    cron = Column(String(100), nullable=True)  # cron 表达式，与 interval_seconds 二选一
+    interval_seconds = Column(Integer, nullable=True)
+    jitter_seconds = Column(Integer, default=0)  # 每次触发随机延后的最大秒数
+    catchup_policy = Column(String(20), default="skip")  # skip, run_once, run_all
+    allow_overlap = Column(Integer, default=0)  # 上一次未结束时是否允许再次触发
+    is_active = Column(Integer, default=1)
+    next_run_at = Column(DateTime)
+    last_run_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    script = relationship("Script")
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+import json
+from pydantic import BaseModel, field_validator
 from datetime import datetime
 from typing import Optional
 
@@ -32,6 +33,10 @@ class MessageCreate(BaseModel):
     is_command: Optional[int] = 0
 
 
+class MessageBatchResponse(BaseModel):
+    ids: list[int]  # 与请求中的消息顺序一致
+
+
 class MessageResponse(BaseModel):
     id: int
     content: str
@@ -40,6 +45,7 @@ class MessageResponse(BaseModel):
     room_id: str
     command_result: Optional[str] = None
     error_message: Optional[str] = None
+    seq: Optional[int] = None
     created_at: datetime
     author: Optional[UserResponse] = None
 
@@ -53,6 +59,12 @@ class ScriptCreate(BaseModel):
     description: Optional[str] = None
     path: str
     command_pattern: str
+    executor: Optional[str] = "subprocess"
+    args_schema: Optional[str] = None
+    rlimit_cpu_seconds: Optional[int] = None
+    rlimit_memory_mb: Optional[int] = None
+    rlimit_nofile: Optional[int] = None
+    idempotent: Optional[int] = 0
 
 
 class ScriptResponse(BaseModel):
@@ -61,6 +73,12 @@ class ScriptResponse(BaseModel):
     description: Optional[str] = None
     path: str
     command_pattern: str
+    executor: Optional[str] = "subprocess"
+    args_schema: Optional[str] = None
+    rlimit_cpu_seconds: Optional[int] = None
+    rlimit_memory_mb: Optional[int] = None
+    rlimit_nofile: Optional[int] = None
+    idempotent: Optional[int] = 0
     is_active: int
     created_at: datetime
 
@@ -78,20 +96,120 @@ class ScriptTaskResponse(BaseModel):
     id: int
     script_id: int
     user_id: int
+    args: Optional[str] = None
     status: str
+    attempts: Optional[int] = None
     exit_code: Optional[int] = None
     output: Optional[str] = None
+    output_hash: Optional[str] = None
     error: Optional[str] = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    cpu_user_seconds: Optional[float] = None
+    cpu_system_seconds: Optional[float] = None
+    io_read_blocks: Optional[int] = None
+    io_write_blocks: Optional[int] = None
+    wall_seconds: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TaskPurgeResponse(BaseModel):
+    deleted_tasks: int
+    deleted_blobs: int
+
+
+class ScriptStats(BaseModel):
+    script_id: int
+    script: str
+    count: int
+    p50_wall_seconds: Optional[float] = None
+    p95_wall_seconds: Optional[float] = None
+    cpu_seconds: float
+
+
+# 定时任务相关
+class ScheduleCreate(BaseModel):
+    script_id: int
+    room_id: Optional[str] = "general"
+    cron: Optional[str] = None
+    interval_seconds: Optional[int] = None
+    jitter_seconds: Optional[int] = 0
+    catchup_policy: Optional[str] = "skip"
+    allow_overlap: Optional[int] = 0
+
+
+class ScheduleResponse(BaseModel):
+    id: int
+    script_id: int
+    user_id: Optional[int] = None
+    room_id: str
+    cron: Optional[str] = None
+    interval_seconds: Optional[int] = None
+    jitter_seconds: int
+    catchup_policy: str
+    allow_overlap: int
+    is_active: int
+    next_run_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# 工作流相关
+class WorkflowStep(BaseModel):
+    name: str
+    script: str  # 脚本名称
+    needs: list[str] = []  # 依赖的步骤
+    # 参数可引用 {{args.0}}、{{steps.<name>.output}}、{{steps.<name>.exit_code}}
+    args: list[str] = []
+
+
+class WorkflowCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    command_pattern: Optional[str] = None
+    steps: list[WorkflowStep]
+
+
+class WorkflowResponse(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    command_pattern: str
+    steps: list[WorkflowStep]
+    is_active: int
+    created_at: datetime
+
+    @field_validator("steps", mode="before")
+    @classmethod
+    def _load_steps(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
 
     class Config:
         from_attributes = True
 
 
+# 在线状态相关
+class PresenceUser(BaseModel):
+    id: int
+    username: str
+    nickname: Optional[str] = None
+    connections: int
+
+
+class PresenceResponse(BaseModel):
+    room_id: str
+    online_count: int
+    users: list[PresenceUser]
+
+
 # WebSocket 消息
 class WSMessage(BaseModel):
-    type: str  # message, command, script_output, user_join, user_leave
+    type: str  # message, command, script_output, presence_delta
     data: dict
 
 
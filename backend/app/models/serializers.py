@@ -0,0 +1,159 @@
+# 历史消息与任务接口的快速序列化：按列查询得到行元组，直接拼成 dict 后编码为
+# JSON bytes，跳过 ORM 实例化和 pydantic 逐字段校验。输出与 MessageResponse /
+# ScriptTaskResponse 保持一致。
+import json
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import func, null, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.models import User, Message, ScriptTask, OutputBlob
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.content,
+    Message.is_command,
+    Message.author_id,
+    Message.room_id,
+    Message.command_result,
+    Message.error_message,
+    Message.seq,
+    Message.created_at,
+)
+
+# 输出保存在 output_blobs 中，早期任务仍内联在 script_tasks.output
+_TASK_OUTPUT = func.coalesce(
+    select(OutputBlob.content)
+    .where(OutputBlob.hash == ScriptTask.output_hash)
+    .scalar_subquery(),
+    ScriptTask.output_text
+).label("output")
+
+TASK_COLUMNS = (
+    ScriptTask.id,
+    ScriptTask.script_id,
+    ScriptTask.user_id,
+    ScriptTask.args,
+    ScriptTask.status,
+    ScriptTask.attempts,
+    ScriptTask.exit_code,
+    _TASK_OUTPUT,
+    ScriptTask.output_hash,
+    ScriptTask.error,
+    ScriptTask.started_at,
+    ScriptTask.completed_at,
+    ScriptTask.cpu_user_seconds,
+    ScriptTask.cpu_system_seconds,
+    ScriptTask.io_read_blocks,
+    ScriptTask.io_write_blocks,
+    ScriptTask.wall_seconds,
+)
+
+
+# 只返回输出哈希，客户端已见过的输出不必重复下载
+TASK_COLUMNS_WITHOUT_OUTPUT = tuple(
+    null().label("output") if column is _TASK_OUTPUT else column
+    for column in TASK_COLUMNS
+)
+
+
+class AuthorCache:
+    """作者信息缓存：用户资料几乎不变，避免每次历史查询都关联 users 表"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.authors: dict[int, dict] = {}
+
+    async def get_many(self, db: AsyncSession, user_ids: Iterable[int]) -> dict[int, dict]:
+        missing = {uid for uid in user_ids if uid is not None and uid not in self.authors}
+        if missing:
+            if len(self.authors) + len(missing) > self.max_size:
+                self.authors.clear()
+            result = await db.execute(
+                select(
+                    User.id, User.username, User.nickname, User.is_admin, User.created_at
+                ).where(User.id.in_(missing))
+            )
+            for uid, username, nickname, is_admin, created_at in result.all():
+                self.authors[uid] = {
+                    "id": uid,
+                    "username": username,
+                    "nickname": nickname,
+                    "is_admin": is_admin,
+                    "created_at": _iso(created_at),
+                }
+        return self.authors
+
+    def invalidate(self, user_id: int):
+        self.authors.pop(user_id, None)
+
+
+author_cache = AuthorCache()
+
+
+def message_rows_to_dicts(rows, authors: dict[int, dict]) -> list[dict]:
+    return [
+        {
+            "id": mid,
+            "content": content,
+            "is_command": is_command,
+            "author_id": author_id,
+            "room_id": room_id,
+            "command_result": command_result,
+            "error_message": error_message,
+            "seq": seq,
+            "created_at": _iso(created_at),
+            "author": authors.get(author_id),
+        }
+        for mid, content, is_command, author_id, room_id, command_result, error_message, seq, created_at in rows
+    ]
+
+
+def task_row_to_dict(row) -> dict:
+    (
+        tid, script_id, user_id, args, status, attempts, exit_code, output, output_hash, error,
+        started_at, completed_at, cpu_user, cpu_system, io_read, io_write, wall
+    ) = row
+    return {
+        "id": tid,
+        "script_id": script_id,
+        "user_id": user_id,
+        "args": args,
+        "status": status,
+        "attempts": attempts,
+        "exit_code": exit_code,
+        "output": output,
+        "output_hash": output_hash,
+        "error": error,
+        "started_at": _iso(started_at),
+        "completed_at": _iso(completed_at),
+        "cpu_user_seconds": cpu_user,
+        "cpu_system_seconds": cpu_system,
+        "io_read_blocks": io_read,
+        "io_write_blocks": io_write,
+        "wall_seconds": wall,
+    }
+
+
+def dump_json(data) -> bytes:
+    return _encode(data).encode("utf-8")
+
+
+def output_ref(output: Optional[str], output_hash: Optional[str]) -> dict:
+    """命令结果中引用脚本输出的字段
+
+    短输出直接内联；长输出只带开头一段预览和 output_hash，完整内容由客户端通过
+    /api/scripts/outputs/{hash} 获取，相同输出只传一次且可以永久缓存。
+    早期任务没有哈希，只能内联。
+    """
+    limit = settings.event_output_inline_chars
+    if output is None or output_hash is None or len(output) <= limit:
+        return {"output": output, "output_hash": output_hash, "output_truncated": False}
+    return {"output": output[:limit], "output_hash": output_hash, "output_truncated": True}
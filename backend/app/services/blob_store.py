@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+from typing import Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.models import OutputBlob
+
+# 支持 INSERT ... ON CONFLICT 的方言，其它数据库先更新再插入
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class BlobStore:
+    """内容寻址的脚本输出存储
+
+    相同内容只保存一份，任务通过哈希引用；ref_count 记录引用数，清理任务时递减，
+    降到 0 的 blob 会被回收。
+    """
+
+    @staticmethod
+    def hash_content(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _fingerprint(content: str) -> tuple[str, int]:
+        """哈希和 UTF-8 字节数，只编码一次"""
+        data = content.encode("utf-8")
+        return hashlib.sha256(data).hexdigest(), len(data)
+
+    async def put(self, db: AsyncSession, content: Optional[str]) -> Optional[str]:
+        """保存内容并增加一次引用，返回哈希；内容为 None 时不保存
+
+        与调用方在同一事务中提交，任务写入失败时引用计数一起回滚。
+        """
+        if content is None:
+            return None
+        if len(content) < settings.offload_threshold_bytes:
+            digest, size = self._fingerprint(content)
+        else:
+            digest, size = await asyncio.to_thread(self._fingerprint, content)
+        values = {"hash": digest, "content": content, "size": size, "ref_count": 1}
+        insert = _UPSERT_INSERTS.get(db.bind.dialect.name)
+        if insert is not None:
+            # 已存在时只递增引用计数，并发写入同一内容也不会冲突
+            await db.execute(insert(OutputBlob).values(**values).on_conflict_do_update(
+                index_elements=[OutputBlob.hash],
+                set_={"ref_count": OutputBlob.ref_count + 1}
+            ))
+        elif not await self._add_ref(db, digest):
+            try:
+                async with db.begin_nested():
+                    await db.execute(OutputBlob.__table__.insert().values(**values))
+            except IntegrityError:
+                # 并发写入了同一内容
+                await self._add_ref(db, digest)
+        return digest
+
+    @staticmethod
+    async def _add_ref(db: AsyncSession, digest: str) -> bool:
+        result = await db.execute(
+            update(OutputBlob)
+            .where(OutputBlob.hash == digest)
+            .values(ref_count=OutputBlob.ref_count + 1)
+        )
+        return result.rowcount > 0
+
+    async def get(self, db: AsyncSession, digest: str) -> Optional[OutputBlob]:
+        return await db.get(OutputBlob, digest)
+
+    async def release(self, db: AsyncSession, counts: dict[str, int]):
+        """按哈希减少引用计数，counts 为每个哈希要减少的次数"""
+        for digest, count in counts.items():
+            await db.execute(
+                update(OutputBlob)
+                .where(OutputBlob.hash == digest)
+                .values(ref_count=OutputBlob.ref_count - count)
+            )
+
+    async def collect_garbage(self, db: AsyncSession) -> int:
+        """删除不再被引用的 blob，返回删除数量"""
+        result = await db.execute(
+            delete(OutputBlob).where(OutputBlob.ref_count <= 0)
+        )
+        return result.rowcount
+
+    async def stats(self, db: AsyncSession) -> dict:
+        """blob 数量、实际占用字节数和总引用数"""
+        result = await db.execute(
+            select(
+                func.count(OutputBlob.hash),
+                func.coalesce(func.sum(OutputBlob.size), 0),
+                func.coalesce(func.sum(OutputBlob.ref_count), 0)
+            )
+        )
+        blobs, stored_bytes, references = result.one()
+        return {"blobs": blobs, "stored_bytes": stored_bytes, "references": references}
+
+
+blob_store = BlobStore()
@@ -0,0 +1,112 @@
+import asyncio
+import selectors
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from app.core.config import settings
+from app.core.stats import percentile
+
+
+class LoopWatchdog:
+    """事件循环延迟监控
+
+    循环内的协程按固定间隔 sleep，实际醒来时间与预期之差即为循环延迟；
+    另有一个后台线程检查心跳，循环卡住超过阈值时抓取循环线程当前的调用栈，
+    定位是哪段同步代码阻塞了所有连接。
+    """
+
+    def __init__(self):
+        self.interval = settings.loop_watchdog_interval_ms / 1000
+        self.threshold = settings.loop_watchdog_threshold_ms / 1000
+        self.samples: deque[float] = deque(maxlen=settings.loop_watchdog_samples)
+        self.stalls: deque[dict] = deque(maxlen=settings.loop_watchdog_max_stalls)
+        self.stall_count = 0
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.ticker: Optional[asyncio.Task] = None
+        self.monitor: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    async def start(self):
+        if self.ticker is not None or self.interval <= 0:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopping.clear()
+        self.ticker = asyncio.create_task(self._tick())
+        self.monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.monitor.start()
+
+    async def stop(self):
+        if self.ticker is None:
+            return
+        self.stopping.set()
+        self.ticker.cancel()
+        try:
+            await self.ticker
+        except asyncio.CancelledError:
+            pass
+        self.ticker = None
+        self.monitor.join(timeout=1)
+        self.monitor = None
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.samples.append(max(0.0, now - expected))
+            self.heartbeat = now
+
+    def _watch(self):
+        """监控线程：心跳超过阈值未更新时记录一次卡顿及当时的调用栈"""
+        captured_for = None
+        while not self.stopping.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or captured_for == heartbeat:
+                continue
+            # 同一次卡顿只抓一次栈
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.stall_count += 1
+            self.stalls.append({
+                "at": datetime.utcnow().isoformat(),
+                "blocked_ms": round(blocked * 1000, 1),
+                # 循环停在 selector 上说明没有同步代码阻塞，而是其它线程长时间占用 GIL
+                "loop_idle": frame.f_code.co_filename == selectors.__file__,
+                "stack": traceback.format_stack(frame),
+            })
+
+    def stats(self) -> dict:
+        """循环延迟百分位数(毫秒)与最近的卡顿记录"""
+        lags = sorted(self.samples)
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "samples": len(lags),
+            "interval_ms": settings.loop_watchdog_interval_ms,
+            "threshold_ms": settings.loop_watchdog_threshold_ms,
+            "p50_ms": ms(percentile(lags, 50)),
+            "p95_ms": ms(percentile(lags, 95)),
+            "p99_ms": ms(percentile(lags, 99)),
+            "max_ms": ms(lags[-1] if lags else None),
+            "stall_count": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+    def reset(self):
+        self.samples.clear()
+        self.stalls.clear()
+        self.stall_count = 0
+
+
+loop_watchdog = LoopWatchdog()
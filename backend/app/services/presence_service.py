@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime
+from app.core.config import settings
+
+
+class PresenceService:
+    """按房间跟踪在线用户，并把短时间内的上下线合并为一次 presence_delta 广播"""
+
+    def __init__(self):
+        self.debounce_seconds = settings.presence_debounce_ms / 1000
+        # room_id -> {user_id: {"user": {...}, "count": 连接数}}
+        self.rooms: dict[str, dict[int, dict]] = {}
+        # room_id -> {user_id: 窗口开始前是否在线}
+        self.pending: dict[str, dict[int, bool]] = {}
+        # room_id -> 窗口开始前的用户信息（用于 left 事件）
+        self.pending_users: dict[str, dict[int, dict]] = {}
+        self.flush_tasks: dict[str, asyncio.Task] = {}
+
+    def join(self, room_id: str, user: dict):
+        """记录一个连接上线（同一用户多标签页会累加引用计数）"""
+        room = self.rooms.setdefault(room_id, {})
+        user_id = user["id"]
+        self._mark(room_id, user_id)
+        entry = room.get(user_id)
+        if entry:
+            entry["count"] += 1
+        else:
+            room[user_id] = {"user": user, "count": 1}
+        self._schedule_flush(room_id)
+
+    def leave(self, room_id: str, user_id: int):
+        """记录一个连接下线，引用计数归零时用户才算离开"""
+        room = self.rooms.get(room_id)
+        if not room or user_id not in room:
+            return
+        self._mark(room_id, user_id)
+        entry = room[user_id]
+        entry["count"] -= 1
+        if entry["count"] <= 0:
+            del room[user_id]
+            if not room:
+                del self.rooms[room_id]
+        self._schedule_flush(room_id)
+
+    def snapshot(self, room_id: str) -> list[dict]:
+        """获取房间当前在线用户"""
+        room = self.rooms.get(room_id, {})
+        return [
+            {**entry["user"], "connections": entry["count"]}
+            for entry in room.values()
+        ]
+
+    def _mark(self, room_id: str, user_id: int):
+        """记录用户在本窗口开始前的在线状态（只记第一次）"""
+        pending = self.pending.setdefault(room_id, {})
+        if user_id not in pending:
+            entry = self.rooms.get(room_id, {}).get(user_id)
+            pending[user_id] = entry is not None
+            if entry:
+                self.pending_users.setdefault(room_id, {})[user_id] = entry["user"]
+
+    def _schedule_flush(self, room_id: str):
+        if room_id in self.flush_tasks:
+            return
+        self.flush_tasks[room_id] = asyncio.create_task(self._flush_later(room_id))
+
+    async def _flush_later(self, room_id: str):
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+        finally:
+            self.flush_tasks.pop(room_id, None)
+        await self.flush(room_id)
+
+    def build_delta(self, room_id: str) -> dict | None:
+        """对比窗口前后的在线状态，生成合并后的变化"""
+        pending = self.pending.pop(room_id, {})
+        previous_users = self.pending_users.pop(room_id, {})
+        room = self.rooms.get(room_id, {})
+        joined = []
+        left = []
+        for user_id, was_online in pending.items():
+            is_online = user_id in room
+            if is_online and not was_online:
+                joined.append(room[user_id]["user"])
+            elif was_online and not is_online:
+                left.append(previous_users.get(user_id, {"id": user_id}))
+        if not joined and not left:
+            return None
+        return {
+            "type": "presence_delta",
+            "data": {
+                "room_id": room_id,
+                "joined": joined,
+                "left": left,
+                "online_count": len(room),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        }
+
+    async def flush(self, room_id: str):
+        """广播房间的合并变化"""
+        from app.api.routes.websocket import manager
+
+        delta = self.build_delta(room_id)
+        if delta:
+            await manager.broadcast(delta, room_id)
+
+
+presence_service = PresenceService()
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import resource
+import signal
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class ProcessResult:
+    exit_code: Optional[int]
+    output: str
+    error: str
+    timed_out: bool = False
+    usage: dict = field(default_factory=dict)
+
+
+def usage_from_rusage(rusage, wall_seconds: float) -> dict:
+    """把 rusage 转成任务上记录的资源字段
+
+    不记录 ru_maxrss：子进程在 fork 时继承了父进程的峰值，exec 后也不会重置，
+    得到的是服务进程自身的内存峰值而不是脚本的。
+    """
+    return {
+        "cpu_user_seconds": rusage.ru_utime,
+        "cpu_system_seconds": rusage.ru_stime,
+        "io_read_blocks": rusage.ru_inblock,
+        "io_write_blocks": rusage.ru_oublock,
+        "wall_seconds": wall_seconds,
+    }
+
+
+def _limit_resources(rlimits: dict[int, int]):
+    """返回在子进程 exec 前设置 rlimit 的函数"""
+    def apply():
+        for limit, value in rlimits.items():
+            resource.setrlimit(limit, (value, value))
+    return apply
+
+
+def _read_outputs(stdout_file, stderr_file) -> tuple[str, str]:
+    stdout_file.seek(0)
+    stderr_file.seek(0)
+    return (
+        stdout_file.read().decode("utf-8", errors="replace"),
+        stderr_file.read().decode("utf-8", errors="replace"),
+    )
+
+
+async def _reap(pid: int):
+    """等待子进程退出并用 wait4 回收，以拿到它的 rusage
+
+    优先用 pidfd 挂到事件循环上，不占线程；不支持时退回线程池阻塞等待。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        return status, rusage
+
+    exited = loop.create_future()
+
+    def on_exit():
+        loop.remove_reader(pidfd)
+        if not exited.done():
+            exited.set_result(None)
+
+    try:
+        loop.add_reader(pidfd, on_exit)
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage
+
+
+async def _stop_group(pid: int, grace: float):
+    """终止整个进程组：先 SIGTERM，宽限期后 SIGKILL，连带清理残留的孙进程"""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    reaper = asyncio.ensure_future(_reap(pid))
+    await asyncio.wait({reaper}, timeout=grace)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return await reaper
+
+
+async def run_process(
+    command: list[str],
+    cwd,
+    timeout: float,
+    rlimits: Optional[dict[int, int]] = None,
+    kill_grace: float = 5
+) -> ProcessResult:
+    """运行子进程，收集输出、退出码和资源占用
+
+    输出写入临时文件而不是管道，回收进程时不依赖 asyncio 的 child watcher，
+    这样才能通过 wait4 拿到该子进程自己的 CPU、内存和 I/O 统计。
+    子进程在独立的进程组中运行，超时或被取消时整组终止。
+    """
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+        started = time.monotonic()
+        process = subprocess.Popen(
+            command,
+            stdout=stdout_file,
+            stderr=stderr_file,
+            cwd=cwd,
+            start_new_session=True,
+            preexec_fn=_limit_resources(rlimits) if rlimits else None
+        )
+        timed_out = False
+        try:
+            status, rusage = await asyncio.wait_for(_reap(process.pid), timeout=timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            status, rusage = await _stop_group(process.pid, kill_grace)
+        except asyncio.CancelledError:
+            # 任务被取消：先确保进程组结束并回收，再把取消继续抛出
+            await _stop_group(process.pid, kill_grace)
+            process.returncode = -signal.SIGTERM
+            raise
+        wall_seconds = time.monotonic() - started
+        # 已经由 wait4 回收，避免 Popen 再次 waitpid
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        # 读文件时释放 GIL，可以与事件循环并行；解码全程持有 GIL，放在哪个线程都一样占用循环
+        output, error = await asyncio.to_thread(_read_outputs, stdout_file, stderr_file)
+        return ProcessResult(
+            exit_code=process.returncode,
+            output=output,
+            error=error,
+            timed_out=timed_out,
+            usage=usage_from_rusage(rusage, wall_seconds)
+        )
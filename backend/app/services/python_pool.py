@@ -0,0 +1,277 @@
+import asyncio
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import resource
+import runpy
+import sys
+import tempfile
+import time
+import traceback
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _capture_fds(captured: dict[int, str]):
+    """把文件描述符 1/2 重定向到临时文件
+
+    只替换 sys.stdout/sys.stderr 收不到子进程和 os.write 的输出，
+    重定向文件描述符后与独立解释器进程收集到的输出一致。
+    """
+    streams = (sys.stdout, sys.stderr)
+    for stream in streams:
+        with contextlib.suppress(AttributeError, ValueError, OSError):
+            stream.flush()
+    files = {fd: tempfile.TemporaryFile() for fd in (1, 2)}
+    saved = {fd: os.dup(fd) for fd in files}
+    try:
+        for fd, file in files.items():
+            os.dup2(file.fileno(), fd)
+        yield
+    finally:
+        # 脚本可能替换或关闭了 sys.stdout/sys.stderr
+        for stream in (sys.stdout, sys.stderr):
+            with contextlib.suppress(AttributeError, ValueError, OSError):
+                stream.flush()
+        sys.stdout, sys.stderr = streams
+        for fd, file in files.items():
+            os.dup2(saved[fd], fd)
+            os.close(saved[fd])
+            file.seek(0)
+            captured[fd] = file.read().decode("utf-8", errors="replace")
+            file.close()
+
+
+def _worker_main(conn: Connection, preload: list[str]):
+    """常驻 worker：预先导入模块，然后循环执行收到的脚本"""
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        script_path, cwd, args = request
+        captured: dict[int, str] = {}
+        exit_code = 0
+        saved_argv = sys.argv
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        with _capture_fds(captured):
+            try:
+                os.chdir(cwd)
+                sys.argv = [script_path, *args]
+                runpy.run_path(script_path, run_name="__main__")
+            except SystemExit as e:
+                if e.code is None:
+                    exit_code = 0
+                elif isinstance(e.code, int):
+                    exit_code = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    exit_code = 1
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.argv = saved_argv
+
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        conn.send({
+            "exit_code": exit_code,
+            "output": captured[1],
+            "error": captured[2],
+            "worker_rss_kb": after.ru_maxrss,
+            "cpu_user_seconds": after.ru_utime - before.ru_utime,
+            "cpu_system_seconds": after.ru_stime - before.ru_stime,
+            "io_read_blocks": after.ru_inblock - before.ru_inblock,
+            "io_write_blocks": after.ru_oublock - before.ru_oublock,
+        })
+
+
+@dataclass
+class PoolResult:
+    exit_code: int
+    output: str
+    error: str
+    usage: dict = field(default_factory=dict)
+
+
+class PoolUnavailable(RuntimeError):
+    """没有可用的 worker：等待超时，或取到的 worker 已经死掉"""
+
+
+class _Worker:
+    def __init__(self, ctx, preload: list[str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, preload),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+        self.baseline_rss_kb: int | None = None
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class PythonPool:
+    """预热的 Python 解释器池，省去每次执行 Python 脚本的启动与导入开销"""
+
+    def __init__(self):
+        self.size = settings.python_pool_size
+        self.preload = settings.python_pool_preload
+        self.max_runs = settings.python_pool_max_runs
+        self.max_rss_growth_kb = settings.python_pool_max_rss_growth_mb * 1024
+        self.idle: asyncio.Queue[_Worker] | None = None
+        self.ctx = None
+        # 正在重启 worker 的后台任务
+        self.respawning: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle is not None
+
+    def start(self):
+        """启动 worker。使用 forkserver 并预加载模块，worker 从干净的进程 fork 出来"""
+        if self.size <= 0 or self.idle is not None:
+            return
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.ctx.set_forkserver_preload([__name__, *self.preload])
+        self.idle = asyncio.Queue()
+        for _ in range(self.size):
+            self.idle.put_nowait(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.ctx, self.preload)
+
+    def shutdown(self):
+        if self.idle is None:
+            return
+        for task in self.respawning:
+            task.cancel()
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            with contextlib.suppress(OSError):
+                worker.conn.send(None)
+            worker.kill()
+        self.idle = None
+
+    @staticmethod
+    def _recv(conn: Connection, timeout: float):
+        if not conn.poll(timeout):
+            raise TimeoutError
+        return conn.recv()
+
+    async def run(
+        self,
+        script_path: str,
+        cwd: str,
+        timeout: float,
+        args: list[str] | None = None
+    ) -> PoolResult:
+        """在空闲 worker 中执行脚本；超时抛出 asyncio.TimeoutError
+
+        等不到空闲 worker 时抛出 PoolUnavailable，由调用方改用独立进程执行。
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            worker = await asyncio.wait_for(
+                self.idle.get(), timeout=settings.python_pool_acquire_timeout
+            )
+        except asyncio.TimeoutError:
+            raise PoolUnavailable(
+                f"No idle Python worker within {settings.python_pool_acquire_timeout}s "
+                f"({len(self.respawning)} restarting)"
+            )
+        started = time.monotonic()
+        recycle = True
+        try:
+            try:
+                worker.conn.send((script_path, str(cwd), args or []))
+                reply = await loop.run_in_executor(None, self._recv, worker.conn, timeout)
+            except TimeoutError:
+                raise asyncio.TimeoutError
+            except EOFError:
+                return PoolResult(exit_code=-1, output="", error="Python worker exited unexpectedly")
+            except OSError as e:
+                # 空闲时 worker 已经死掉（OOM、崩溃）：回收它，脚本改用独立进程执行
+                raise PoolUnavailable(f"Python worker {worker.process.pid} is gone: {e}")
+            worker.runs += 1
+            if worker.baseline_rss_kb is None:
+                worker.baseline_rss_kb = reply["worker_rss_kb"]
+            # worker 的峰值内存只用来判断是否回收；它是整个 worker 生命周期的峰值，
+            # 不能代表本次运行，所以不记录到任务上
+            recycle = (
+                worker.runs >= self.max_runs
+                or reply["worker_rss_kb"] - worker.baseline_rss_kb > self.max_rss_growth_kb
+            )
+            return PoolResult(
+                exit_code=reply["exit_code"],
+                output=reply["output"],
+                error=reply["error"],
+                usage={
+                    "cpu_user_seconds": reply["cpu_user_seconds"],
+                    "cpu_system_seconds": reply["cpu_system_seconds"],
+                    "io_read_blocks": reply["io_read_blocks"],
+                    "io_write_blocks": reply["io_write_blocks"],
+                    "wall_seconds": time.monotonic() - started,
+                }
+            )
+        finally:
+            if recycle:
+                self._replace(worker)
+            else:
+                self._return(worker)
+
+    def _replace(self, worker: _Worker):
+        """在后台回收 worker 并启动新的"""
+        task = asyncio.get_running_loop().create_task(self._respawn(worker))
+        self.respawning.add(task)
+        task.add_done_callback(self.respawning.discard)
+
+    async def _respawn(self, worker: _Worker):
+        """结束和 fork 进程会阻塞，放到线程池执行；启动失败时退避重试，池的大小不会悄悄变小"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, worker.kill)
+        except Exception:
+            logger.exception("Failed to stop Python pool worker %s", worker.process.pid)
+        delay = 1.0
+        while self.idle is not None:
+            try:
+                replacement = await loop.run_in_executor(None, self._spawn)
+            except Exception:
+                logger.exception("Failed to start Python pool worker, retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.python_pool_respawn_max_delay)
+            else:
+                self._return(replacement)
+                return
+
+    def _return(self, worker: _Worker):
+        if self.idle is not None:
+            self.idle.put_nowait(worker)
+        else:
+            worker.kill()
+
+
+python_pool = PythonPool()
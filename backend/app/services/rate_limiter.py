@@ -0,0 +1,138 @@
+import time
+from collections import Counter
+from app.core.config import settings
+
+
+class TokenBucket:
+    """令牌桶：按 rate 每秒补充令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def consume(self):
+        self.tokens -= 1
+
+    def retry_after(self) -> float:
+        """距离下一个令牌可用的秒数"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        """令牌已补满，与新建的桶等价，可以安全丢弃"""
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """按连接/用户/房间限流，并对每个房间及整个进程的连接数做准入控制"""
+
+    SCOPES = ("connection", "user", "room")
+    KINDS = ("message", "command")
+
+    def __init__(self):
+        # (kind, scope, key) -> TokenBucket
+        self.buckets: dict[tuple[str, str, object], TokenBucket] = {}
+        self.room_connections: Counter[str] = Counter()
+        self.total_connections = 0
+        self.rejections: Counter[str] = Counter()
+        self.swept_at = time.monotonic()
+
+    def _limits(self, kind: str, scope: str) -> tuple[float, int]:
+        rate = getattr(settings, f"{kind}_rate_per_{scope}")
+        burst = getattr(settings, f"{kind}_burst_per_{scope}")
+        return rate, burst
+
+    def _bucket(self, kind: str, scope: str, key) -> TokenBucket | None:
+        rate, burst = self._limits(kind, scope)
+        if rate <= 0:
+            return None
+        bucket = self.buckets.get((kind, scope, key))
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            self.buckets[(kind, scope, key)] = bucket
+        return bucket
+
+    def acquire_connection(self) -> bool:
+        """尝试接纳一个新连接，超出进程连接上限时返回 False"""
+        if settings.max_connections_total and self.total_connections >= settings.max_connections_total:
+            self.rejections["connection:total"] += 1
+            return False
+        self.total_connections += 1
+        return True
+
+    def join_room(self, room_id: str) -> bool:
+        """连接加入/订阅房间，超出房间连接上限时返回 False"""
+        if settings.max_connections_per_room and self.room_connections[room_id] >= settings.max_connections_per_room:
+            self.rejections["connection:room"] += 1
+            return False
+        self.room_connections[room_id] += 1
+        return True
+
+    def leave_room(self, room_id: str):
+        self.room_connections[room_id] -= 1
+        if self.room_connections[room_id] <= 0:
+            del self.room_connections[room_id]
+
+    def release_connection(self, connection_id: int):
+        """释放连接占用的名额和连接级令牌桶"""
+        self.total_connections -= 1
+        for kind in self.KINDS:
+            self.buckets.pop((kind, "connection", connection_id), None)
+
+    def _sweep(self, now: float):
+        """丢弃已补满的用户/房间令牌桶，内存占用只与近期活跃的用户和房间数有关"""
+        interval = settings.rate_limit_sweep_interval_seconds
+        if interval <= 0 or now - self.swept_at < interval:
+            return
+        self.swept_at = now
+        idle = [key for key, bucket in self.buckets.items() if bucket.is_full(now)]
+        for key in idle:
+            del self.buckets[key]
+
+    def check(
+        self,
+        kind: str,
+        connection_id: int,
+        user_id: int,
+        room_id: str
+    ) -> float | None:
+        """检查一次发送是否允许；允许返回 None，否则返回建议重试的秒数
+
+        所有层级都有令牌时才一起扣减，避免被拒绝的请求消耗其它层级的额度。
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        keys = {"connection": connection_id, "user": user_id, "room": room_id}
+        buckets = []
+        for scope in self.SCOPES:
+            bucket = self._bucket(kind, scope, keys[scope])
+            if bucket is None:
+                continue
+            if not bucket.available(now):
+                self.rejections[f"{kind}:{scope}"] += 1
+                return bucket.retry_after()
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.consume()
+        return None
+
+    def stats(self) -> dict:
+        """限流统计，用于线上调参"""
+        return {
+            "total_connections": self.total_connections,
+            "room_connections": dict(self.room_connections),
+            "buckets": len(self.buckets),
+            "rejections": dict(self.rejections),
+        }
+
+
+rate_limiter = RateLimiter()
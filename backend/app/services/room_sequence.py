@@ -0,0 +1,94 @@
+from collections import deque
+from sqlalchemy import event, func, select
+from app.core.config import settings
+from app.models.models import Message
+
+
+class RoomSequencer:
+    """每个房间单调递增的序号
+
+    消息每次插入或更新都会拿到新的序号，客户端用最后看到的序号就能补齐断线期间的
+    新消息和命令结果更新。计数在进程内维护，首次使用时从数据库读取当前最大值。
+    """
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+
+    def next(self, connection, room_id: str) -> int:
+        if room_id not in self.counters:
+            current = connection.execute(
+                select(func.max(Message.seq)).where(Message.room_id == room_id)
+            ).scalar()
+            # 查询期间可能已有其它会话完成初始化，以先到者为准
+            self.counters.setdefault(room_id, current or 0)
+        self.counters[room_id] += 1
+        return self.counters[room_id]
+
+
+class ReplayBuffer:
+    """每个房间最近广播过的消息事件，用于断线重连时快速补发"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.rooms: dict[str, deque[tuple[int, dict]]] = {}
+        # 房间 -> {序号: 消息 id}，记录最近分配出去的序号属于哪条消息
+        self.assigned: dict[str, dict[int, int]] = {}
+
+    def assign(self, room_id: str, seq: int, message_id: int):
+        """记录序号的归属；同一条消息之后的更新会取代这个序号，不需要单独补发"""
+        assigned = self.assigned.setdefault(room_id, {})
+        assigned[seq] = message_id
+        if len(assigned) > self.size * 2:
+            del assigned[next(iter(assigned))]
+
+    def record(self, room_id: str, seq: int, evt: dict):
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            buffer = self.rooms[room_id] = deque(maxlen=self.size)
+        buffer.append((seq, evt))
+
+    def since(self, room_id: str, last_seq: int) -> list[dict] | None:
+        """返回 last_seq 之后的事件；缓冲区覆盖不到时返回 None，由调用方查库
+
+        序号在 flush 时分配、提交后才广播，并发写入时 N+1 可能先于 N 记录进来。
+        last_seq 之后到缓冲区最新序号之间的每个序号，要么在缓冲区里，要么所属消息
+        已有更新的事件在缓冲区里；否则（还没广播或已被挤出）只能查库。
+        还没分配出去的更大序号会在订阅后实时送达。
+        """
+        buffer = self.rooms.get(room_id)
+        if not buffer:
+            return None
+        newer = {seq: evt for seq, evt in buffer if seq > last_seq}
+        if not newer:
+            return [] if min(seq for seq, _ in buffer) <= last_seq + 1 else None
+        newest: dict[int, int] = {}
+        for seq, evt in newer.items():
+            message_id = evt["data"]["id"]
+            newest[message_id] = max(seq, newest.get(message_id, seq))
+        assigned = self.assigned.get(room_id, {})
+        for seq in range(last_seq + 1, max(newer)):
+            if seq in newer:
+                continue
+            owner = assigned.get(seq)
+            if owner is None or newest.get(owner, 0) <= seq:
+                return None
+        # 同一条消息多次更新时只补发最新状态，按序号顺序补发
+        return [newer[seq] for seq in sorted(newest.values())]
+
+
+room_sequencer = RoomSequencer()
+replay_buffer = ReplayBuffer(settings.replay_buffer_size)
+
+
+@event.listens_for(Message, "before_insert")
+@event.listens_for(Message, "before_update")
+def _assign_seq(mapper, connection, target: Message):
+    if target.room_id is None:
+        target.room_id = "general"
+    target.seq = room_sequencer.next(connection, target.room_id)
+
+
+@event.listens_for(Message, "after_insert")
+@event.listens_for(Message, "after_update")
+def _remember_seq(mapper, connection, target: Message):
+    replay_buffer.assign(target.room_id, target.seq, target.id)
@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.models import Schedule, Script, Message, User
+from app.models.serializers import output_ref
+from app.services.cron import CronExpression
+from app.services.script_service import script_service
+
+
+CATCHUP_POLICIES = ("skip", "run_once", "run_all")
+
+
+def compute_next_run(schedule: Schedule, after: datetime) -> datetime:
+    """计算 after 之后的下一个计划时间（不含抖动）"""
+    if schedule.cron:
+        return CronExpression(schedule.cron).next_after(after)
+    return after + timedelta(seconds=schedule.interval_seconds)
+
+
+def advance_next_run(schedule: Schedule, now: datetime) -> datetime:
+    """从原计划时间向后推进到 now 之后的第一个计划时间
+
+    以计划时间而不是实际触发时间为起点，抖动和延迟只影响单次触发，不会累积到计划上。
+    """
+    if not schedule.next_run_at:
+        return compute_next_run(schedule, now)
+    if schedule.cron:
+        return compute_next_run(schedule, max(now, schedule.next_run_at))
+    if schedule.next_run_at > now:
+        return schedule.next_run_at
+    # 停机较久时逐次推进太慢，直接算出跳过的周期数
+    interval = timedelta(seconds=schedule.interval_seconds)
+    return schedule.next_run_at + interval * ((now - schedule.next_run_at) // interval + 1)
+
+
+def utc_timestamp(naive_utc: datetime) -> float:
+    """数据库里存的是不带时区的 UTC 时间；直接调用 timestamp() 会被当成本地时间"""
+    return naive_utc.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Scheduler:
+    """定时触发脚本：单个最小堆 + 一个等待协程驱动所有计划"""
+
+    def __init__(self):
+        # (触发时间戳, schedule_id, 版本号)
+        self.heap: list[tuple[float, int, int]] = []
+        self.versions: dict[int, int] = {}
+        self.running: set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.loop_task: asyncio.Task | None = None
+        # 触发与补跑任务：事件循环只保留弱引用，这里持有引用直到任务结束
+        self.tasks: set[asyncio.Task] = set()
+        self.skipped_overlaps = 0
+
+    async def start(self):
+        """加载已保存的计划，按补偿策略处理错过的运行，然后启动调度循环"""
+        from app.core.database import async_session
+
+        now = datetime.utcnow()
+        async with async_session() as db:
+            result = await db.execute(select(Schedule).where(Schedule.is_active == 1))
+            for schedule in result.scalars().all():
+                missed = self._count_missed(schedule, now)
+                if missed:
+                    runs = 1 if schedule.catchup_policy == "run_once" else missed
+                    if schedule.catchup_policy != "skip":
+                        self._spawn(self._catch_up(schedule.id, runs))
+                if not schedule.next_run_at or schedule.next_run_at <= now:
+                    schedule.next_run_at = advance_next_run(schedule, now)
+                self._push(schedule)
+            await db.commit()
+
+        self.loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.loop_task:
+            self.loop_task.cancel()
+            self.loop_task = None
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _count_missed(self, schedule: Schedule, now: datetime) -> int:
+        """统计停机期间错过的次数（最多 scheduler_max_catchup_runs 次）"""
+        count = 0
+        next_run = schedule.next_run_at
+        while next_run and next_run <= now and count < settings.scheduler_max_catchup_runs:
+            count += 1
+            next_run = compute_next_run(schedule, next_run)
+        return count
+
+    def _push(self, schedule: Schedule):
+        version = self.versions.get(schedule.id, 0) + 1
+        self.versions[schedule.id] = version
+        jitter = random.uniform(0, schedule.jitter_seconds or 0)
+        fire_at = utc_timestamp(schedule.next_run_at) + jitter
+        heapq.heappush(self.heap, (fire_at, schedule.id, version))
+        self.wakeup.set()
+
+    def add(self, schedule: Schedule):
+        """新增或更新计划后加入堆"""
+        self._push(schedule)
+
+    def remove(self, schedule_id: int):
+        """移除计划；堆中的旧条目通过版本号失效"""
+        self.versions.pop(schedule_id, None)
+        self.wakeup.set()
+
+    async def _loop(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            # 丢弃失效条目，触发所有到期计划
+            while self.heap and (
+                self.versions.get(self.heap[0][1]) != self.heap[0][2]
+                or self.heap[0][0] <= now
+            ):
+                _, schedule_id, version = heapq.heappop(self.heap)
+                if self.versions.get(schedule_id) == version:
+                    self._spawn(self._fire(schedule_id))
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, schedule_id: int):
+        """到期触发：推进下一次计划时间，再执行脚本"""
+        from app.core.database import async_session
+
+        async with async_session() as db:
+            schedule = await db.get(Schedule, schedule_id)
+            if not schedule or not schedule.is_active:
+                return
+            now = datetime.utcnow()
+            schedule.last_run_at = now
+            schedule.next_run_at = advance_next_run(schedule, now)
+            await db.commit()
+            self._push(schedule)
+            allow_overlap = schedule.allow_overlap
+
+        if schedule_id in self.running and not allow_overlap:
+            self.skipped_overlaps += 1
+            return
+        await self._run(schedule_id)
+
+    async def _catch_up(self, schedule_id: int, runs: int):
+        """补跑停机期间错过的运行，逐次执行"""
+        for _ in range(runs):
+            while schedule_id in self.running:
+                await asyncio.sleep(1)
+            await self._run(schedule_id)
+
+    async def _run(self, schedule_id: int):
+        from app.core.database import async_session
+        from app.api.routes.websocket import manager, message_event
+
+        self.running.add(schedule_id)
+        try:
+            async with async_session() as db:
+                schedule = await db.get(Schedule, schedule_id)
+                if not schedule:
+                    return
+                script = await db.get(Script, schedule.script_id)
+                if not script or not script.is_active:
+                    return
+                task = await script_service.execute_script(db, script, schedule.user_id)
+                task = await script_service.wait_task(db, task.id)
+
+                # 结果作为一条命令消息发送到目标房间
+                message = Message(
+                    content=script.command_pattern,
+                    author_id=schedule.user_id,
+                    room_id=schedule.room_id,
+                    is_command=1,
+                    command_result=json.dumps({
+                        "type": "script_completed",
+                        "task_id": task.id,
+                        "script": script.name,
+                        "schedule_id": schedule.id,
+                        "status": task.status,
+                        "exit_code": task.exit_code,
+                        **output_ref(task.output, task.output_hash),
+                        "error": task.error
+                    }),
+                    created_at=datetime.utcnow()
+                )
+                db.add(message)
+                await db.commit()
+                await db.refresh(message)
+                author = await db.get(User, schedule.user_id) if schedule.user_id else None
+
+            await manager.broadcast(message_event(message, author), message.room_id)
+        finally:
+            self.running.discard(schedule_id)
+
+    async def create_schedule(
+        self,
+        db: AsyncSession,
+        script_id: int,
+        user_id: int,
+        room_id: str = "general",
+        cron: Optional[str] = None,
+        interval_seconds: Optional[int] = None,
+        jitter_seconds: int = 0,
+        catchup_policy: str = "skip",
+        allow_overlap: int = 0
+    ) -> Schedule:
+        """创建计划（cron 与 interval_seconds 二选一）"""
+        if bool(cron) == bool(interval_seconds):
+            raise ValueError("Exactly one of cron or interval_seconds is required")
+        if interval_seconds is not None and interval_seconds <= 0:
+            raise ValueError("interval_seconds must be positive")
+        if catchup_policy not in CATCHUP_POLICIES:
+            raise ValueError(f"catchup_policy must be one of {', '.join(CATCHUP_POLICIES)}")
+        if cron:
+            CronExpression(cron)
+
+        schedule = Schedule(
+            script_id=script_id,
+            user_id=user_id,
+            room_id=room_id,
+            cron=cron,
+            interval_seconds=interval_seconds,
+            jitter_seconds=jitter_seconds or 0,
+            catchup_policy=catchup_policy,
+            allow_overlap=allow_overlap,
+            created_at=datetime.utcnow()
+        )
+        schedule.next_run_at = compute_next_run(schedule, datetime.utcnow())
+        db.add(schedule)
+        await db.commit()
+        await db.refresh(schedule)
+        self.add(schedule)
+        return schedule
+
+    async def get_all_schedules(self, db: AsyncSession) -> list[Schedule]:
+        result = await db.execute(select(Schedule).where(Schedule.is_active == 1))
+        return list(result.scalars().all())
+
+    async def delete_schedule(self, db: AsyncSession, schedule_id: int) -> bool:
+        """停用计划"""
+        schedule = await db.get(Schedule, schedule_id)
+        if not schedule or not schedule.is_active:
+            return False
+        schedule.is_active = 0
+        await db.commit()
+        self.remove(schedule_id)
+        return True
+
+
+scheduler = Scheduler()
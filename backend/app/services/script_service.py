@@ -1,19 +1,30 @@
 import asyncio
-import subprocess
+import json
+import re
 import os
+import resource
+import sys
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 from app.models.models import Script, ScriptTask
 from app.models.schemas import ScriptTaskResponse
+from app.models.serializers import output_ref
 from app.core.config import settings
+from app.core.stats import percentile
+from app.services.python_pool import PoolUnavailable, python_pool
+from app.services.blob_store import blob_store
+from app.services.process_runner import run_process
 
 
 class ScriptService:
     def __init__(self):
         self.scripts_dir = settings.scripts_dir
-        self.running_tasks: dict[int, asyncio.subprocess.Process] = {}
+        self.running_tasks: dict[int, asyncio.Task] = {}
+        self.cancel_requested: set[int] = set()
+        self.task_done_events: dict[int, asyncio.Event] = {}
 
     async def register_script(
         self,
@@ -21,14 +32,32 @@ class ScriptService:
         name: str,
         path: str,
         description: str = None,
-        command_pattern: str = None
+        command_pattern: str = None,
+        executor: str = "subprocess",
+        args_schema: str = None,
+        rlimit_cpu_seconds: int = None,
+        rlimit_memory_mb: int = None,
+        rlimit_nofile: int = None,
+        idempotent: int = 0
     ) -> Script:
-        """注册一个新脚本"""
+        """注册一个新脚本
+
+        args_schema 为 JSON，例如：
+        {"args": [{"name": "host", "pattern": "^[\\w.-]+$"}], "fanout": true}
+        """
+        if args_schema:
+            self._load_args_schema(args_schema)
         script = Script(
             name=name,
             path=path,
             description=description,
             command_pattern=command_pattern or f"/{name}",
+            executor=executor,
+            args_schema=args_schema,
+            rlimit_cpu_seconds=rlimit_cpu_seconds,
+            rlimit_memory_mb=rlimit_memory_mb,
+            rlimit_nofile=rlimit_nofile,
+            idempotent=idempotent,
         )
         db.add(script)
         await db.commit()
@@ -56,11 +85,104 @@ class ScriptService:
         )
         return result.scalar_one_or_none()
 
+    @staticmethod
+    def _load_args_schema(args_schema: str) -> dict:
+        try:
+            schema = json.loads(args_schema)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid args_schema: {e}")
+        if not isinstance(schema, dict) or not isinstance(schema.get("args", []), list):
+            raise ValueError("args_schema must be an object with an 'args' list")
+        for arg in schema.get("args", []):
+            if not isinstance(arg, dict) or "name" not in arg:
+                raise ValueError("Each argument needs a 'name'")
+            if arg.get("pattern"):
+                try:
+                    re.compile(arg["pattern"])
+                except re.error as e:
+                    raise ValueError(f"Invalid pattern for {arg['name']}: {e}")
+        return schema
+
+    @staticmethod
+    def usage(script: Script) -> str:
+        """命令用法，如 /check <host> [port]"""
+        if not script.args_schema:
+            return script.command_pattern
+        schema = json.loads(script.args_schema)
+        parts = [script.command_pattern]
+        for arg in schema.get("args", []):
+            name = arg["name"]
+            parts.append(f"<{name}>" if arg.get("required", True) else f"[{name}]")
+        if schema.get("fanout"):
+            parts.append("...")
+        return " ".join(parts)
+
+    def build_arg_sets(self, script: Script, args: list[str]) -> list[list[str]]:
+        """按脚本声明的参数校验命令参数，返回一组或多组（扇出）参数
+
+        未声明参数的脚本忽略命令后的内容；声明了 fanout 的脚本可以一次给出多组参数，
+        每组参数数量等于声明的参数个数。
+        """
+        if not script.args_schema:
+            return [[]]
+        schema = json.loads(script.args_schema)
+        defs = schema.get("args", [])
+        size = len(defs)
+
+        if len(args) <= size:
+            arg_sets = [args]
+        elif schema.get("fanout") and size and len(args) % size == 0:
+            arg_sets = [args[i:i + size] for i in range(0, len(args), size)]
+            if len(arg_sets) > settings.fanout_max_targets:
+                raise ValueError(f"Too many targets (max {settings.fanout_max_targets})")
+        else:
+            raise ValueError(f"Too many arguments. Usage: {self.usage(script)}")
+
+        for arg_set in arg_sets:
+            for i, arg in enumerate(defs):
+                if i >= len(arg_set):
+                    if arg.get("required", True):
+                        raise ValueError(f"Missing argument <{arg['name']}>. Usage: {self.usage(script)}")
+                    continue
+                pattern = arg.get("pattern")
+                if pattern and not re.fullmatch(pattern, arg_set[i]):
+                    raise ValueError(f"Invalid value for <{arg['name']}>: {arg_set[i]}")
+        return arg_sets
+
+    async def execute_fanout(
+        self,
+        script: Script,
+        user_id: int,
+        arg_sets: list[list[str]],
+        results: list[Optional[dict]]
+    ):
+        """并发执行多组参数（受 fanout_max_concurrency 限制），结果按完成情况写入 results"""
+        from app.core.database import async_session
+
+        semaphore = asyncio.Semaphore(settings.fanout_max_concurrency)
+
+        async def run_one(index: int, args: list[str]):
+            async with semaphore:
+                async with async_session() as db:
+                    task = await self.execute_script(db, script, user_id, args)
+                    task = await self.wait_task(db, task.id)
+            results[index] = {
+                "args": args,
+                "task_id": task.id,
+                "status": task.status,
+                "exit_code": task.exit_code,
+                **output_ref(task.output, task.output_hash),
+                "error": task.error
+            }
+
+        await asyncio.gather(*(run_one(i, args) for i, args in enumerate(arg_sets)))
+
     async def execute_script(
         self,
         db: AsyncSession,
         script: Script,
-        user_id: int
+        user_id: int,
+        args: Optional[list[str]] = None
     ) -> ScriptTaskResponse:
         """执行脚本并返回任务信息"""
         from datetime import datetime
@@ -69,7 +191,9 @@ class ScriptService:
         task = ScriptTask(
             script_id=script.id,
             user_id=user_id,
+            args=json.dumps(args) if args else None,
             status="pending",
+            attempts=1,
             started_at=datetime.utcnow()
         )
         db.add(task)
@@ -77,14 +201,83 @@ class ScriptService:
         await db.refresh(task)
 
         # 异步执行脚本（只传 task id，避免 session 问题）
-        asyncio.create_task(self._run_script(task.id, script.id))
+        self._start(task.id, script.id, args or [])
 
         return ScriptTaskResponse.model_validate(task)
 
+    def _start(self, task_id: int, script_id: int, args: list[str]):
+        """启动任务协程并登记，供等待和取消使用"""
+        self.task_done_events[task_id] = asyncio.Event()
+        runner = asyncio.create_task(self._run_script(task_id, script_id, args))
+        self.running_tasks[task_id] = runner
+        runner.add_done_callback(lambda _: self._notify_task_done(task_id))
+
+    async def recover_tasks(self):
+        """启动时处理上次进程遗留的 pending/running 任务
+
+        幂等脚本的任务重新排队（最多 task_max_attempts 次），其余标记为失败。
+        """
+        from datetime import datetime
+        from app.core.database import async_session
+
+        async with async_session() as db:
+            result = await db.execute(
+                select(ScriptTask, Script)
+                .join(Script, Script.id == ScriptTask.script_id)
+                .where(ScriptTask.status.in_(("pending", "running")))
+            )
+            requeue = []
+            for task, script in result.all():
+                if script.idempotent and script.is_active and (task.attempts or 1) < settings.task_max_attempts:
+                    task.status = "pending"
+                    task.attempts = (task.attempts or 1) + 1
+                    requeue.append((task.id, script.id, json.loads(task.args) if task.args else []))
+                else:
+                    task.status = "failed"
+                    task.error = "Interrupted by server restart"
+                    task.completed_at = datetime.utcnow()
+            await db.commit()
+
+        for task_id, script_id, args in requeue:
+            self._start(task_id, script_id, args)
+
+    async def cancel_task(
+        self,
+        db: AsyncSession,
+        task_id: int
+    ) -> Optional[ScriptTaskResponse]:
+        """取消任务：终止整个进程组，任务状态记为 cancelled"""
+        from datetime import datetime
+
+        task = await self.get_task(db, task_id)
+        if not task or task.status not in ("pending", "running"):
+            return task
+
+        runner = self.running_tasks.get(task_id)
+        if runner:
+            self.cancel_requested.add(task_id)
+            runner.cancel()
+            await asyncio.wait({runner}, timeout=settings.task_kill_grace_seconds + 5)
+
+        # 协程在开始执行前就被取消，或任务不属于当前进程时，直接更新记录
+        result = await db.execute(
+            select(ScriptTask)
+            .where(ScriptTask.id == task_id)
+            .execution_options(populate_existing=True)
+        )
+        row = result.scalar_one_or_none()
+        if row and row.status in ("pending", "running"):
+            row.status = "cancelled"
+            row.error = "Cancelled"
+            row.completed_at = datetime.utcnow()
+            await db.commit()
+        return await self.get_task(db, task_id)
+
     async def _run_script(
         self,
         task_id: int,
-        script_id: int
+        script_id: int,
+        args: list[str]
     ):
         """实际运行脚本的内部方法"""
         from datetime import datetime
@@ -109,57 +302,77 @@ class ScriptService:
                 task.status = "running"
                 await db.commit()
 
-        # 解析脚本路径
-        script_path = Path(script.path)
-        if not script_path.is_absolute():
-            script_path = self.scripts_dir / script_path
-        script_path = script_path.resolve()
+        # 路径解析和文件检查会访问文件系统，放到线程中执行，不阻塞事件循环
+        script_path, error = await asyncio.to_thread(self._check_script, script)
 
         exit_code = None
         output = None
-        error = None
+        usage = {}
         final_status = "failed"
 
-        # 检查文件是否存在
-        if not script_path.exists():
-            error = f"Script file not found: {script_path}"
-        elif not script_path.is_file():
-            error = f"Not a file: {script_path}"
-        elif not os.access(script_path, os.X_OK):
-            error = f"Script not executable: {script_path}"
-        else:
+        use_pool = error is None and script.executor == "python_pool" and python_pool.enabled
+        if use_pool:
+            # Python 入口脚本交给预热的解释器池执行
             try:
-                # 执行脚本
-                process = await asyncio.create_subprocess_exec(
+                pool_result = await python_pool.run(
                     str(script_path),
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    cwd=self.scripts_dir
+                    cwd=self.scripts_dir,
+                    timeout=settings.max_script_runtime,
+                    args=args
                 )
+                exit_code = pool_result.exit_code
+                output = pool_result.output
+                error = pool_result.error or None
+                usage = pool_result.usage
+                final_status = "completed" if exit_code == 0 else "failed"
+            except PoolUnavailable:
+                # 所有 worker 都忙或正在重启，退回到独立解释器进程
+                use_pool = False
+            except asyncio.TimeoutError:
+                error = f"Script execution timed out after {settings.max_script_runtime} seconds"
+            except asyncio.CancelledError:
+                # 非用户取消（如进程退出）时保留 running 状态，由下次启动时恢复
+                if task_id not in self.cancel_requested:
+                    raise
+                final_status = "cancelled"
+                error = "Cancelled"
+            except Exception as e:
+                error = str(e)
+        if error is None and not use_pool:
+            # 解释器池未启用或没有空闲 worker 时，Python 入口脚本退回到独立解释器进程
+            if script.executor == "python_pool":
+                command = [sys.executable, str(script_path), *args]
+            else:
+                command = [str(script_path), *args]
+            try:
+                # 执行脚本（超时会被 kill），同时收集资源占用
+                result = await run_process(
+                    command,
+                    cwd=self.scripts_dir,
+                    timeout=settings.max_script_runtime,
+                    rlimits=self._rlimits(script),
+                    kill_grace=settings.task_kill_grace_seconds
+                )
+                usage = result.usage
 
-                # 设置超时
-                try:
-                    stdout, stderr = await asyncio.wait_for(
-                        process.communicate(),
-                        timeout=settings.max_script_runtime
-                    )
-
-                    exit_code = process.returncode
-                    output = stdout.decode('utf-8')
-                    error = stderr.decode('utf-8') if stderr else None
+                if result.timed_out:
+                    error = f"Script execution timed out after {settings.max_script_runtime} seconds"
+                else:
+                    exit_code = result.exit_code
+                    output = result.output
+                    error = result.error or None
 
-                    if process.returncode == 0:
+                    if exit_code == 0:
                         final_status = "completed"
                     else:
                         final_status = "failed"
 
-                except asyncio.TimeoutError:
-                    process.kill()
-                    error = f"Script execution timed out after {settings.max_script_runtime} seconds"
-
-                except Exception as e:
-                    error = str(e)
-
+            except asyncio.CancelledError:
+                # 非用户取消（如进程退出）时保留 running 状态，由下次启动时恢复
+                if task_id not in self.cancel_requested:
+                    raise
+                final_status = "cancelled"
+                error = "Cancelled"
             except Exception as e:
                 error = str(e)
 
@@ -172,11 +385,100 @@ class ScriptService:
             if task:
                 task.status = final_status
                 task.exit_code = exit_code
-                task.output = output
+                task.output_hash = await blob_store.put(db, output)
                 task.error = error
                 task.completed_at = datetime.utcnow()
+                for key, value in usage.items():
+                    setattr(task, key, value)
                 await db.commit()
 
+    def _check_script(self, script: Script) -> tuple[Path, Optional[str]]:
+        """解析脚本路径并检查文件，返回 (路径, 错误信息)"""
+        script_path = Path(script.path)
+        if not script_path.is_absolute():
+            script_path = self.scripts_dir / script_path
+        script_path = script_path.resolve()
+
+        if not script_path.exists():
+            return script_path, f"Script file not found: {script_path}"
+        if not script_path.is_file():
+            return script_path, f"Not a file: {script_path}"
+        # Python 入口脚本由解释器执行，不要求可执行权限
+        if script.executor != "python_pool" and not os.access(script_path, os.X_OK):
+            return script_path, f"Script not executable: {script_path}"
+        return script_path, None
+
+    @staticmethod
+    def _rlimits(script: Script) -> dict[int, int]:
+        """脚本配置的资源上限（仅对子进程执行方式生效）"""
+        rlimits = {}
+        if script.rlimit_cpu_seconds:
+            rlimits[resource.RLIMIT_CPU] = script.rlimit_cpu_seconds
+        if script.rlimit_memory_mb:
+            rlimits[resource.RLIMIT_AS] = script.rlimit_memory_mb * 1024 * 1024
+        if script.rlimit_nofile:
+            rlimits[resource.RLIMIT_NOFILE] = script.rlimit_nofile
+        return rlimits
+
+    def _notify_task_done(self, task_id: int):
+        self.running_tasks.pop(task_id, None)
+        self.cancel_requested.discard(task_id)
+        event = self.task_done_events.pop(task_id, None)
+        if event:
+            event.set()
+
+    async def wait_task(
+        self,
+        db: AsyncSession,
+        task_id: int
+    ) -> Optional[ScriptTaskResponse]:
+        """等待任务结束并返回最终状态"""
+        event = self.task_done_events.get(task_id)
+        if event:
+            await event.wait()
+        return await self.get_task(db, task_id)
+
+    async def get_script_stats(
+        self,
+        db: AsyncSession,
+        script_id: Optional[int] = None
+    ) -> list[dict]:
+        """按脚本汇总已结束任务的运行时间和 CPU"""
+        query = (
+            select(
+                Script.id,
+                Script.name,
+                ScriptTask.wall_seconds,
+                ScriptTask.cpu_user_seconds,
+                ScriptTask.cpu_system_seconds
+            )
+            .join(ScriptTask, ScriptTask.script_id == Script.id)
+            .where(ScriptTask.completed_at.is_not(None))
+        )
+        if script_id is not None:
+            query = query.where(Script.id == script_id)
+        result = await db.execute(query)
+
+        grouped: dict[int, dict] = {}
+        for sid, name, wall, cpu_user, cpu_system in result.all():
+            stats = grouped.setdefault(sid, {
+                "script_id": sid,
+                "script": name,
+                "count": 0,
+                "walls": [],
+                "cpu_seconds": 0.0
+            })
+            stats["count"] += 1
+            if wall is not None:
+                stats["walls"].append(wall)
+            stats["cpu_seconds"] += (cpu_user or 0) + (cpu_system or 0)
+
+        for stats in grouped.values():
+            walls = sorted(stats.pop("walls"))
+            stats["p50_wall_seconds"] = percentile(walls, 50)
+            stats["p95_wall_seconds"] = percentile(walls, 95)
+        return list(grouped.values())
+
     async def get_task(
         self,
         db: AsyncSession,
@@ -184,10 +486,35 @@ class ScriptService:
     ) -> Optional[ScriptTaskResponse]:
         """获取任务状态"""
         result = await db.execute(
-            select(ScriptTask).where(ScriptTask.id == task_id)
+            select(ScriptTask)
+            .where(ScriptTask.id == task_id)
+            .execution_options(populate_existing=True)
         )
         task = result.scalar_one_or_none()
         return ScriptTaskResponse.model_validate(task) if task else None
 
+    async def purge_tasks(
+        self,
+        db: AsyncSession,
+        before: datetime,
+        script_id: Optional[int] = None
+    ) -> dict:
+        """删除 before 之前结束的任务，释放它们引用的输出并回收无人引用的 blob"""
+        conditions = [ScriptTask.completed_at < before]
+        if script_id is not None:
+            conditions.append(ScriptTask.script_id == script_id)
+
+        result = await db.execute(
+            select(ScriptTask.output_hash, func.count())
+            .where(*conditions, ScriptTask.output_hash.is_not(None))
+            .group_by(ScriptTask.output_hash)
+        )
+        counts = dict(result.all())
+        deleted = await db.execute(delete(ScriptTask).where(*conditions))
+        await blob_store.release(db, counts)
+        deleted_blobs = await blob_store.collect_garbage(db)
+        await db.commit()
+        return {"deleted_tasks": deleted.rowcount, "deleted_blobs": deleted_blobs}
+
 
 script_service = ScriptService()
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import re
+import time
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.models import Script, Workflow
+from app.models.serializers import output_ref
+from app.services.script_service import script_service
+
+# 步骤参数中的占位符：{{args.0}}、{{steps.build.output}}、{{steps.build.exit_code}}
+_PLACEHOLDER = re.compile(r"\{\{\s*([\w.-]+)\s*\}\}")
+_STEP_REF = re.compile(r"^steps\.([\w-]+)\.(output|exit_code)$")
+_ARG_REF = re.compile(r"^args\.(\d+)$")
+
+
+class WorkflowService:
+    """工作流：按依赖关系并发执行多个脚本步骤
+
+    没有依赖关系的步骤同时运行，后续步骤通过参数占位符拿到前面步骤的输出或退出码；
+    任一步骤失败时取消正在运行的步骤，其余步骤标记为 skipped。
+    """
+
+    @staticmethod
+    def _dependencies(steps: list[dict]) -> dict[str, set[str]]:
+        """每个步骤的全部上游步骤（含间接依赖）"""
+        needs = {step["name"]: set(step.get("needs", [])) for step in steps}
+        resolved: dict[str, set[str]] = {}
+
+        def visit(name: str, path: tuple[str, ...]) -> set[str]:
+            if name in path:
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + (name,))}")
+            if name not in resolved:
+                upstream = set()
+                for dep in needs[name]:
+                    upstream |= {dep} | visit(dep, path + (name,))
+                resolved[name] = upstream
+            return resolved[name]
+
+        for name in needs:
+            visit(name, ())
+        return resolved
+
+    def validate_steps(self, steps: list[dict]):
+        """检查步骤名唯一、依赖存在且无环，参数只引用上游步骤"""
+        if not steps:
+            raise ValueError("A workflow needs at least one step")
+        if len(steps) > settings.workflow_max_steps:
+            raise ValueError(f"At most {settings.workflow_max_steps} steps per workflow")
+        names = [step["name"] for step in steps]
+        if len(set(names)) != len(names):
+            raise ValueError("Step names must be unique")
+        for step in steps:
+            for dep in step.get("needs", []):
+                if dep not in names:
+                    raise ValueError(f"Step '{step['name']}' needs unknown step '{dep}'")
+
+        upstream = self._dependencies(steps)
+        for step in steps:
+            for arg in step.get("args", []):
+                for ref in _PLACEHOLDER.findall(arg):
+                    if _ARG_REF.match(ref):
+                        continue
+                    match = _STEP_REF.match(ref)
+                    if not match:
+                        raise ValueError(f"Unknown placeholder {{{{{ref}}}}} in step '{step['name']}'")
+                    if match.group(1) not in upstream[step["name"]]:
+                        raise ValueError(
+                            f"Step '{step['name']}' uses output of '{match.group(1)}' "
+                            f"without depending on it"
+                        )
+
+    @staticmethod
+    def validate_step_args(steps: list[dict], schemas: dict[str, Optional[str]]):
+        """按脚本的 args_schema 检查步骤参数个数，schemas 为脚本名到 args_schema 的映射
+
+        未声明参数的脚本会忽略全部参数，给它传参数（比如上游输出）不会生效，直接拒绝。
+        """
+        for step in steps:
+            args = step.get("args", [])
+            if not args:
+                continue
+            schema = schemas.get(step["script"])
+            if not schema:
+                raise ValueError(
+                    f"Step '{step['name']}' passes arguments to script '{step['script']}', "
+                    f"which declares none"
+                )
+            declared = len(json.loads(schema).get("args", []))
+            if len(args) > declared:
+                raise ValueError(
+                    f"Step '{step['name']}' passes {len(args)} arguments to script "
+                    f"'{step['script']}', which declares {declared}"
+                )
+
+    async def create_workflow(
+        self,
+        db: AsyncSession,
+        name: str,
+        steps: list[dict],
+        description: str = None,
+        command_pattern: str = None
+    ) -> Workflow:
+        """创建工作流，步骤引用的脚本必须已注册"""
+        self.validate_steps(steps)
+        script_names = {step["script"] for step in steps}
+        result = await db.execute(
+            select(Script.name, Script.args_schema)
+            .where(Script.name.in_(script_names), Script.is_active == 1)
+        )
+        schemas = dict(result.all())
+        missing = script_names - set(schemas)
+        if missing:
+            raise ValueError(f"Unknown scripts: {', '.join(sorted(missing))}")
+        self.validate_step_args(steps, schemas)
+
+        command_pattern = command_pattern or f"/{name}"
+        if await script_service.get_script_by_pattern(db, command_pattern):
+            raise ValueError(f"Command {command_pattern} is already used by a script")
+
+        workflow = Workflow(
+            name=name,
+            description=description,
+            command_pattern=command_pattern,
+            steps=json.dumps(steps),
+        )
+        db.add(workflow)
+        await db.commit()
+        await db.refresh(workflow)
+        return workflow
+
+    async def get_all_workflows(self, db: AsyncSession) -> list[Workflow]:
+        result = await db.execute(select(Workflow).where(Workflow.is_active == 1))
+        return list(result.scalars().all())
+
+    async def get_workflow_by_pattern(
+        self,
+        db: AsyncSession,
+        command_pattern: str
+    ) -> Optional[Workflow]:
+        result = await db.execute(
+            select(Workflow).where(
+                Workflow.command_pattern == command_pattern,
+                Workflow.is_active == 1
+            )
+        )
+        return result.scalar_one_or_none()
+
+    async def delete_workflow(self, db: AsyncSession, workflow_id: int) -> bool:
+        """停用工作流"""
+        workflow = await db.get(Workflow, workflow_id)
+        if not workflow or not workflow.is_active:
+            return False
+        workflow.is_active = 0
+        await db.commit()
+        return True
+
+    @staticmethod
+    def _render_args(
+        step: dict,
+        args: list[str],
+        results: dict[str, dict],
+        outputs: dict[str, Optional[str]]
+    ) -> list[str]:
+        def replace(match: re.Match) -> str:
+            ref = match.group(1)
+            arg = _ARG_REF.match(ref)
+            if arg:
+                index = int(arg.group(1))
+                if index >= len(args):
+                    raise ValueError(f"Missing workflow argument {index + 1}")
+                return args[index]
+            name, field = _STEP_REF.match(ref).groups()
+            # 事件里的输出可能被截断，渲染参数用完整输出
+            value = outputs[name] if field == "output" else results[name][field]
+            if value is None:
+                return ""
+            return value.strip() if field == "output" else str(value)
+
+        return [_PLACEHOLDER.sub(replace, arg) for arg in step.get("args", [])]
+
+    async def _run_step(
+        self,
+        step: dict,
+        state: dict,
+        results: dict[str, dict],
+        outputs: dict[str, Optional[str]],
+        user_id: int,
+        args: list[str],
+        stop: asyncio.Event
+    ):
+        """运行一个步骤，结果写入 state，完整输出写入 outputs"""
+        from app.core.database import async_session
+
+        async with async_session() as db:
+            result = await db.execute(
+                select(Script).where(Script.name == step["script"], Script.is_active == 1)
+            )
+            script = result.scalar_one_or_none()
+            try:
+                if not script:
+                    raise ValueError(f"Script '{step['script']}' not found")
+                # 脚本在创建工作流之后可能被重新注册为不接受参数
+                if step.get("args") and not script.args_schema:
+                    raise ValueError(f"Script '{step['script']}' takes no arguments")
+                arg_sets = script_service.build_arg_sets(
+                    script, self._render_args(step, args, results, outputs)
+                )
+                if len(arg_sets) != 1:
+                    raise ValueError("Workflow steps cannot fan out")
+            except ValueError as e:
+                state.update(status="failed", error=str(e))
+                return
+
+            task = await script_service.execute_script(db, script, user_id, arg_sets[0])
+            state["task_id"] = task.id
+            # 启动期间其它步骤已经失败
+            if stop.is_set():
+                await script_service.cancel_task(db, task.id)
+            task = await script_service.wait_task(db, task.id)
+
+        outputs[step["name"]] = task.output
+        state.update(
+            status=task.status,
+            exit_code=task.exit_code,
+            **output_ref(task.output, task.output_hash),
+            error=task.error,
+            wall_seconds=task.wall_seconds
+        )
+
+    async def run(
+        self,
+        workflow: Workflow,
+        user_id: int,
+        args: list[str],
+        on_update: Callable[[dict], Awaitable[None]]
+    ) -> dict:
+        """执行工作流，每当步骤状态变化时调用 on_update，返回最终状态"""
+        from app.core.database import async_session
+
+        steps = json.loads(workflow.steps)
+        states = {
+            step["name"]: {
+                "name": step["name"],
+                "script": step["script"],
+                "needs": step.get("needs", []),
+                "status": "pending",
+                "task_id": None,
+                "exit_code": None,
+                "output": None,
+                "output_hash": None,
+                "output_truncated": False,
+                "error": None,
+                "wall_seconds": None,
+            }
+            for step in steps
+        }
+        summary = {
+            "type": "workflow",
+            "workflow": workflow.name,
+            "status": "running",
+            "steps": list(states.values()),
+            "wall_seconds": None,
+        }
+        outputs: dict[str, Optional[str]] = {}
+        stop = asyncio.Event()
+        running: dict[asyncio.Task, str] = {}
+        started = time.monotonic()
+
+        while True:
+            if not stop.is_set():
+                for step in steps:
+                    state = states[step["name"]]
+                    if state["status"] == "pending" and all(
+                        states[dep]["status"] == "completed" for dep in state["needs"]
+                    ):
+                        state["status"] = "running"
+                        runner = asyncio.create_task(
+                            self._run_step(step, state, states, outputs, user_id, args, stop)
+                        )
+                        running[runner] = step["name"]
+            if not running:
+                break
+            await on_update(summary)
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for runner in done:
+                name = running.pop(runner)
+                if runner.exception():
+                    states[name].update(status="failed", error=str(runner.exception()))
+                if states[name]["status"] != "completed" and not stop.is_set():
+                    # 快速失败：取消仍在运行的步骤，不再启动新步骤
+                    stop.set()
+                    async with async_session() as db:
+                        for other in running.values():
+                            if states[other]["task_id"] is not None:
+                                await script_service.cancel_task(db, states[other]["task_id"])
+
+        for state in states.values():
+            if state["status"] == "pending":
+                state["status"] = "skipped"
+        summary["status"] = "failed" if stop.is_set() else "completed"
+        summary["wall_seconds"] = time.monotonic() - started
+        await on_update(summary)
+        return summary
+
+
+workflow_service = WorkflowService()
@@ -0,0 +1,97 @@
+# 事件循环延迟对比：以当前默认配置为基准，每次只还原一项改动，分别测量各项的影响
+#   sql_echo        打开 SQL 日志
+#   inline_output   在命令结果事件里内联完整输出（不截断为预览 + 哈希）
+#   hash_on_loop    在事件循环内计算输出哈希
+# 延迟数据来自内置的 loop_watchdog，即 /api/diagnostics/loop 的输出
+#
+# 用法（在 backend 目录下）：python -m benchmarks.loop_lag [输出 MB] [命令次数]
+import logging
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/bench.db")
+os.environ.setdefault("LOOP_WATCHDOG_INTERVAL_MS", "5")
+os.environ.setdefault("LOOP_WATCHDOG_THRESHOLD_MS", "50")
+# 连续发送命令，关闭命令限流
+for _scope in ("connection", "user", "room"):
+    os.environ.setdefault(f"COMMAND_RATE_PER_{_scope.upper()}", "0")
+
+import json
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.core.database import engine
+from app.main import app
+
+# SQL 日志写到 /dev/null：保留格式化日志的开销，不刷屏
+_sql_log = logging.StreamHandler(open(os.devnull, "w"))
+logging.getLogger("sqlalchemy.engine.Engine").addHandler(_sql_log)
+
+
+def write_script(size_mb: int) -> str:
+    path = os.path.join(_db_dir, "big_output.sh")
+    with open(path, "w") as f:
+        f.write(f"#!/bin/sh\nhead -c {size_mb * 1024 * 1024} /dev/zero | tr '\\0' 'x'\n")
+    os.chmod(path, 0o755)
+    return path
+
+
+def run_commands(client: TestClient, commands: int) -> dict:
+    client.post("/api/diagnostics/loop/reset")
+    with client.websocket_connect("/ws/bench") as ws:
+        for _ in range(commands):
+            ws.send_json({"type": "message", "content": "/big"})
+            while True:
+                event = ws.receive_json()
+                result = event.get("data", {}).get("command_result")
+                if result and json.loads(result)["type"] == "script_completed":
+                    break
+    return client.get("/api/diagnostics/loop").json()
+
+
+def report(name: str, stats: dict):
+    print(
+        f"{name:<14} p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+        f"p99={stats['p99_ms']:.2f}ms max={stats['max_ms']:.2f}ms stalls={stats['stall_count']}"
+    )
+
+
+# 每个变体只改一项配置，其余保持默认
+VARIANTS = {
+    "default": {},
+    "sql_echo": {"sql_echo": True},
+    "inline_output": {"event_output_inline_chars": sys.maxsize},
+    "hash_on_loop": {"offload_threshold_bytes": sys.maxsize},
+}
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    commands = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    defaults = {key: getattr(settings, key) for variant in VARIANTS.values() for key in variant}
+
+    results = {}
+    with TestClient(app) as client:
+        client.post("/api/scripts/register", params={
+            "name": "big_output", "path": write_script(size_mb), "command_pattern": "/big"
+        })
+        # 预热：首次执行的导入、建表和 blob 插入不计入任何变体
+        run_commands(client, 1)
+        for name, overrides in VARIANTS.items():
+            for key, value in {**defaults, **overrides}.items():
+                setattr(settings, key, value)
+            engine.sync_engine.echo = settings.sql_echo
+            results[name] = run_commands(client, commands)
+
+    print(f"output={size_mb}MB commands={commands} interval={settings.loop_watchdog_interval_ms}ms")
+    for name, stats in results.items():
+        report(name, stats)
+    for name, stats in results.items():
+        if stats["recent_stalls"]:
+            print(f"last stall in {name}:")
+            print("".join(stats["recent_stalls"][-1]["stack"][-4:]))
+
+
+if __name__ == "__main__":
+    main()
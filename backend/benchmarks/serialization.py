@@ -0,0 +1,91 @@
+# 历史消息接口序列化对比：原 response_model 路径 vs 按列查询 + 直接输出 JSON
+#
+# 用法（在 backend 目录下）：python -m benchmarks.serialization [消息数] [请求次数]
+import os
+import sys
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/bench.db")
+
+from datetime import datetime
+from typing import List
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.core.database import engine, async_session, get_db, init_db
+from app.models.models import User, Message
+from app.models.schemas import MessageResponse
+from app.api.routes.messages import get_messages
+
+
+async def seed(count: int):
+    await init_db()
+    async with async_session() as db:
+        users = [User(username=f"bench_{i}", nickname=f"Bench {i}", is_admin=0) for i in range(5)]
+        db.add_all(users)
+        await db.flush()
+        db.add_all(
+            Message(
+                content=f"status line {i} " + "x" * 80,
+                author_id=users[i % len(users)].id,
+                room_id="bench",
+                is_command=0,
+                created_at=datetime.utcnow()
+            )
+            for i in range(count)
+        )
+        await db.commit()
+
+
+app = FastAPI()
+
+
+@app.get("/legacy", response_model=List[MessageResponse])
+async def legacy_messages(limit: int = 50, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(Message)
+        .options(selectinload(Message.author))
+        .where(Message.room_id == "bench")
+        .order_by(Message.created_at.desc())
+        .limit(limit)
+    )
+    return list(reversed(list(result.scalars().all())))
+
+
+@app.get("/fast")
+async def fast_messages(limit: int = 50, db: AsyncSession = Depends(get_db)):
+    return await get_messages(room_id="bench", limit=limit, db=db)
+
+
+def bench(client: TestClient, path: str, limit: int, requests: int) -> float:
+    client.get(path, params={"limit": limit})
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, params={"limit": limit})
+    return (time.perf_counter() - started) / requests * 1000
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    # 关闭 SQL 日志，只比较查询与序列化
+    engine.sync_engine.echo = False
+
+    with TestClient(app) as client:
+        client.portal.call(seed, limit)
+        assert client.get("/legacy", params={"limit": limit}).json() == \
+            client.get("/fast", params={"limit": limit}).json()
+        legacy = bench(client, "/legacy", limit, requests)
+        fast = bench(client, "/fast", limit, requests)
+
+    print(f"limit={limit} requests={requests}")
+    print(f"response_model: {legacy:.2f} ms/request")
+    print(f"fast path:      {fast:.2f} ms/request ({legacy / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.core.database import Base
+from app.models.models import OutputBlob
+from app.services import blob_store as blob_store_module
+from app.services.blob_store import blob_store
+
+
+def _put_twice(tmp_path) -> OutputBlob:
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'blobs.db'}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                first = await blob_store.put(db, "same output")
+                second = await blob_store.put(db, "same output")
+                assert first == second == blob_store.hash_content("same output")
+                await db.commit()
+            async with AsyncSession(engine) as db:
+                return await blob_store.get(db, first)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_put_deduplicates_with_on_conflict(tmp_path):
+    blob = _put_twice(tmp_path)
+    assert blob.content == "same output"
+    assert blob.size == len("same output")
+    assert blob.ref_count == 2
+
+
+def test_put_deduplicates_without_on_conflict(tmp_path, monkeypatch):
+    # 其它数据库走先更新再插入的路径
+    monkeypatch.setattr(blob_store_module, "_UPSERT_INSERTS", {})
+    blob = _put_twice(tmp_path)
+    assert blob.ref_count == 2
+
+
+def test_put_none_is_not_stored():
+    assert asyncio.run(blob_store.put(None, None)) is None
@@ -0,0 +1,75 @@
+from datetime import datetime
+import pytest
+from app.services.cron import CronError, CronExpression
+
+
+@pytest.mark.parametrize("expression, weekdays", [
+    ("0 0 * * *", {0, 1, 2, 3, 4, 5, 6}),
+    ("0 0 * * 0", {0}),
+    ("0 0 * * 7", {0}),
+    ("0 0 * * 5-7", {5, 6, 0}),
+    ("0 0 * * 0-7", {0, 1, 2, 3, 4, 5, 6}),
+    ("0 0 * * 1,7", {1, 0}),
+    ("0 0 * * */2", {0, 2, 4, 6}),
+    ("0 0 * * 1-5", {1, 2, 3, 4, 5}),
+])
+def test_weekday_field(expression, weekdays):
+    assert CronExpression(expression).weekdays == weekdays
+
+
+def test_fields():
+    cron = CronExpression("*/15 9-17 1,15 */3 *")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == set(range(9, 18))
+    assert cron.days == {1, 15}
+    assert cron.months == {1, 4, 7, 10}
+
+
+def test_step_from_single_value():
+    assert CronExpression("10/20 * * * *").minutes == {10, 30, 50}
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "* * * * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "* * * * 8",
+    "5-1 * * * *",
+    "*/0 * * * *",
+    "a * * * *",
+    "1-x * * * *",
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
+
+
+def test_next_after():
+    # 2024-01-01 是周一
+    start = datetime(2024, 1, 1, 12, 0)
+    assert CronExpression("30 * * * *").next_after(start) == datetime(2024, 1, 1, 12, 30)
+    assert CronExpression("0 0 * * *").next_after(start) == datetime(2024, 1, 2, 0, 0)
+    assert CronExpression("0 0 * * 7").next_after(start) == datetime(2024, 1, 7, 0, 0)
+    assert CronExpression("0 0 * * 0").next_after(start) == datetime(2024, 1, 7, 0, 0)
+    assert CronExpression("0 0 1 * *").next_after(start) == datetime(2024, 2, 1, 0, 0)
+    assert CronExpression("0 0 29 2 *").next_after(start) == datetime(2024, 2, 29, 0, 0)
+
+
+def test_next_after_is_strictly_later():
+    at = datetime(2024, 1, 1, 12, 30, 15)
+    assert CronExpression("30 12 * * *").next_after(at) == datetime(2024, 1, 2, 12, 30)
+
+
+def test_day_and_weekday_match_either():
+    # 日和周同时限定时满足其一即可：1 号或周五
+    cron = CronExpression("0 0 1 * 5")
+    assert cron.next_after(datetime(2024, 1, 1, 0, 0)) == datetime(2024, 1, 5, 0, 0)
+    assert cron.next_after(datetime(2024, 1, 26, 0, 0)) == datetime(2024, 2, 1, 0, 0)
+
+
+def test_unreachable_expression():
+    with pytest.raises(CronError):
+        CronExpression("0 0 31 2 *").next_after(datetime(2024, 1, 1))
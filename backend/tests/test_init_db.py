@@ -0,0 +1,134 @@
+import asyncio
+import sqlite3
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.core.database import Base, init_db
+from app.models.models import Script, ScriptTask
+
+# 初始版本 create_all 建出的表结构
+BASELINE_SCHEMA = """
+CREATE TABLE scripts (
+    id INTEGER NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    description TEXT,
+    path VARCHAR(255) NOT NULL,
+    command_pattern VARCHAR(100),
+    is_active INTEGER,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_scripts_name ON scripts (name);
+CREATE INDEX ix_scripts_id ON scripts (id);
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    nickname VARCHAR(100),
+    is_admin INTEGER,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE messages (
+    id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    is_command INTEGER,
+    author_id INTEGER,
+    room_id VARCHAR(50),
+    command_result TEXT,
+    error_message TEXT,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(author_id) REFERENCES users (id)
+);
+CREATE INDEX ix_messages_id ON messages (id);
+CREATE TABLE script_tasks (
+    id INTEGER NOT NULL,
+    script_id INTEGER,
+    user_id INTEGER,
+    status VARCHAR(20),
+    exit_code INTEGER,
+    output TEXT,
+    error TEXT,
+    started_at DATETIME,
+    completed_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(script_id) REFERENCES scripts (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_script_tasks_id ON script_tasks (id);
+INSERT INTO users (id, username, nickname, is_admin) VALUES (1, 'user', 'User', 1);
+INSERT INTO scripts (id, name, path, command_pattern, is_active) VALUES (1, 'hello', 'hello.sh', '/hello', 1);
+INSERT INTO script_tasks (id, script_id, user_id, status, exit_code, output)
+    VALUES (1, 1, 1, 'completed', 0, 'Hello World');
+"""
+
+
+def _migrate(path) -> dict:
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            await init_db(engine)
+            # 重复执行不应报错
+            await init_db(engine)
+            async with AsyncSession(engine) as db:
+                script = (await db.execute(select(Script))).scalar_one()
+                task = (await db.execute(select(ScriptTask))).unique().scalar_one()
+                result = {"script": script, "task": task}
+            async with engine.connect() as conn:
+                result["schema"] = await conn.run_sync(lambda sync_conn: {
+                    table: {
+                        "columns": {c["name"] for c in inspect(sync_conn).get_columns(table)},
+                        "indexes": {i["name"] for i in inspect(sync_conn).get_indexes(table)},
+                    }
+                    for table in inspect(sync_conn).get_table_names()
+                })
+            return result
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_init_db_upgrades_baseline_database(tmp_path):
+    path = tmp_path / "baseline.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    result = _migrate(path)
+
+    for table in Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} <= result["schema"][table.name]["columns"]
+        assert {index.name for index in table.indexes} <= result["schema"][table.name]["indexes"]
+
+    # 新增列按模型默认值回填旧数据
+    script = result["script"]
+    assert script.executor == "subprocess"
+    assert script.idempotent == 0
+    assert script.args_schema is None
+
+    # 旧任务的输出仍内联在 output 列中
+    task = result["task"]
+    assert task.output_hash is None
+    assert task.output == "Hello World"
+    assert task.attempts == 1
+
+
+def test_init_db_creates_missing_tables(tmp_path):
+    path = tmp_path / "partial.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA.split("CREATE TABLE users")[0].replace(
+            "CREATE UNIQUE INDEX ix_scripts_name ON scripts (name);", ""
+        ))
+        conn.execute("INSERT INTO scripts (id, name, path) VALUES (1, 'hello', 'hello.sh')")
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            await init_db(engine)
+            async with engine.connect() as conn:
+                return await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        finally:
+            await engine.dispose()
+
+    assert {table.name for table in Base.metadata.sorted_tables} <= set(asyncio.run(run()))
@@ -0,0 +1,64 @@
+from app.services.room_sequence import ReplayBuffer
+
+
+def event(message_id: int, seq: int) -> dict:
+    return {"type": "message", "data": {"id": message_id, "seq": seq}}
+
+
+def seqs(events: list[dict]) -> list[int]:
+    return [e["data"]["seq"] for e in events]
+
+
+def test_since_returns_events_after_last_seq():
+    buffer = ReplayBuffer(10)
+    for seq in range(1, 6):
+        buffer.record("r", seq, event(seq, seq))
+    assert seqs(buffer.since("r", 2)) == [3, 4, 5]
+    assert buffer.since("r", 5) == []
+    assert buffer.since("r", 0) is not None
+
+
+def test_since_keeps_latest_state_of_updated_message():
+    buffer = ReplayBuffer(10)
+    buffer.record("r", 1, event(1, 1))
+    buffer.record("r", 2, event(2, 2))
+    buffer.record("r", 3, event(1, 3))
+    assert seqs(buffer.since("r", 0)) == [2, 3]
+
+
+def test_since_falls_back_when_evicted():
+    buffer = ReplayBuffer(3)
+    for seq in range(1, 6):
+        buffer.record("r", seq, event(seq, seq))
+    assert buffer.since("r", 1) is None
+    assert seqs(buffer.since("r", 2)) == [3, 4, 5]
+    assert buffer.since("other", 0) is None
+
+
+def test_since_falls_back_on_gap_from_out_of_order_broadcast():
+    buffer = ReplayBuffer(10)
+    buffer.record("r", 1, event(1, 1))
+    # seq 3 先于 seq 2 广播
+    buffer.record("r", 3, event(3, 3))
+    assert buffer.since("r", 1) is None
+    assert buffer.since("r", 0) is None
+    assert seqs(buffer.since("r", 3)) == []
+
+    buffer.record("r", 2, event(2, 2))
+    assert seqs(buffer.since("r", 1)) == [2, 3]
+
+
+def test_since_skips_seq_superseded_by_later_update():
+    buffer = ReplayBuffer(10)
+    buffer.record("r", 1, event(1, 1))
+    # 命令消息插入时拿到 2，结果写回时拿到 3，只广播了 3
+    buffer.assign("r", 2, 2)
+    buffer.assign("r", 3, 2)
+    buffer.record("r", 3, event(2, 3))
+    assert seqs(buffer.since("r", 1)) == [3]
+    assert seqs(buffer.since("r", 0)) == [1, 3]
+
+    # 2 已分配但其消息还没有更新的事件广播出来
+    buffer.assign("r", 4, 4)
+    buffer.record("r", 5, event(5, 5))
+    assert buffer.since("r", 3) is None
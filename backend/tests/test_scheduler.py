@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timedelta
+from app.models.models import Schedule
+from app.services.scheduler import advance_next_run, utc_timestamp
+
+
+START = datetime(2024, 1, 1)
+
+
+def test_interval_with_jitter_does_not_drift():
+    schedule = Schedule(interval_seconds=60, jitter_seconds=30, next_run_at=START)
+    planned = []
+    for _ in range(20):
+        # 每次都因抖动和延迟晚触发
+        fired_at = schedule.next_run_at + timedelta(seconds=random.uniform(0, 30) + 20)
+        schedule.next_run_at = advance_next_run(schedule, fired_at)
+        planned.append(schedule.next_run_at)
+    assert planned == [START + timedelta(minutes=i) for i in range(1, 21)]
+
+
+def test_interval_skips_missed_periods():
+    schedule = Schedule(interval_seconds=60, next_run_at=START)
+    now = START + timedelta(days=30, seconds=90)
+    assert advance_next_run(schedule, now) == START + timedelta(days=30, seconds=120)
+    assert advance_next_run(schedule, START + timedelta(seconds=60)) == START + timedelta(seconds=120)
+
+
+def test_cron_advances_past_now():
+    schedule = Schedule(cron="*/5 * * * *", next_run_at=START)
+    now = START + timedelta(minutes=12)
+    assert advance_next_run(schedule, now) == START + timedelta(minutes=15)
+
+
+def test_without_previous_run():
+    schedule = Schedule(interval_seconds=60, next_run_at=None)
+    assert advance_next_run(schedule, START) == START + timedelta(seconds=60)
+
+
+def test_utc_timestamp_ignores_local_timezone(monkeypatch):
+    import time
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        # 夏令时切换当天
+        assert utc_timestamp(datetime(2024, 3, 10, 7, 30)) == 1710055800
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
@@ -0,0 +1,71 @@
+import json
+import pytest
+from app.services.workflow_service import workflow_service
+
+
+def step(name: str, needs: list[str] = (), args: list[str] = (), script: str = "s") -> dict:
+    return {"name": name, "script": script, "needs": list(needs), "args": list(args)}
+
+
+def test_valid_dag():
+    workflow_service.validate_steps([
+        step("build"),
+        step("lint"),
+        step("test", needs=["build", "lint"], args=["{{steps.build.output}}", "{{args.0}}"]),
+        step("deploy", needs=["test"], args=["{{steps.build.output}}", "{{ steps.lint.exit_code }}"]),
+    ])
+
+
+@pytest.mark.parametrize("steps, error", [
+    ([], "at least one step"),
+    ([step("a"), step("a")], "unique"),
+    ([step("a", needs=["missing"])], "unknown step 'missing'"),
+    ([step("a", needs=["a"])], "cycle: a -> a"),
+    ([step("a", needs=["b"]), step("b", needs=["a"])], "cycle"),
+    ([step("a", needs=["c"]), step("b", needs=["a"]), step("c", needs=["b"])], "cycle"),
+    ([step("a", args=["{{env.HOME}}"])], "Unknown placeholder"),
+    ([step("a", args=["{{steps.b.stdout}}"]), step("b")], "Unknown placeholder"),
+    ([step("a", args=["{{steps.b.output}}"]), step("b")], "without depending on it"),
+    ([step("a", needs=["b"], args=["{{steps.c.output}}"]), step("b"), step("c")], "without depending on it"),
+])
+def test_invalid_dag(steps, error):
+    with pytest.raises(ValueError, match=error):
+        workflow_service.validate_steps(steps)
+
+
+def test_indirect_dependency_output_is_allowed():
+    workflow_service.validate_steps([
+        step("a"),
+        step("b", needs=["a"]),
+        step("c", needs=["b"], args=["{{steps.a.output}}"]),
+    ])
+
+
+def test_too_many_steps(monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "workflow_max_steps", 2)
+    with pytest.raises(ValueError, match="At most 2 steps"):
+        workflow_service.validate_steps([step("a"), step("b"), step("c")])
+
+
+SCHEMA = json.dumps({"args": [{"name": "version"}]})
+
+
+def test_args_to_script_without_schema_rejected():
+    steps = [
+        step("build", script="build"),
+        step("notify", needs=["build"], args=["{{steps.build.output}}"], script="notify"),
+    ]
+    with pytest.raises(ValueError, match="declares none"):
+        workflow_service.validate_step_args(steps, {"build": None, "notify": None})
+    workflow_service.validate_step_args(steps, {"build": None, "notify": SCHEMA})
+
+
+def test_too_many_args_rejected():
+    steps = [step("deploy", args=["v1", "extra"], script="deploy")]
+    with pytest.raises(ValueError, match="passes 2 arguments"):
+        workflow_service.validate_step_args(steps, {"deploy": SCHEMA})
+
+
+def test_steps_without_args_need_no_schema():
+    workflow_service.validate_step_args([step("a"), step("b", needs=["a"])], {"s": None})
@@ -8,6 +8,7 @@ export interface Message {
   author_id: number
   room_id: string
   is_command: number
+  seq?: number | null
   created_at: string
   author?: {
     id: number
@@ -48,3 +49,18 @@ export async function getCommands(): Promise<Command[]> {
   const response = await api.get<Command[]>('/api/scripts/commands')
   return response.data
 }
+
+// 脚本输出按内容哈希寻址且不可变，同一哈希只请求一次
+const outputCache = new Map<string, Promise<string>>()
+
+export function getOutput(hash: string): Promise<string> {
+  let output = outputCache.get(hash)
+  if (!output) {
+    output = api
+      .get<string>(`/api/scripts/outputs/${hash}`, { responseType: 'text' })
+      .then(response => response.data)
+    output.catch(() => outputCache.delete(hash))
+    outputCache.set(hash, output)
+  }
+  return output
+}
@@ -5,17 +5,36 @@ const WS_URL = import.meta.env.VITE_WS_URL ||
 
 type EventCallback = (data: any) => void
 
-export function useWebSocket(room: Ref<string>) {
+const RECONNECT_MAX_DELAY = 10000
+
+// lastSeq 返回客户端已经看到的最大序号，重连时带上以便服务端只补发缺失的事件
+export function useWebSocket(room: Ref<string>, lastSeq?: () => number) {
   const ws = ref<WebSocket | null>(null)
   const listeners = ref<Map<string, Set<EventCallback>>>(new Map())
+  let manualClose = false
+  let reconnectDelay = 500
+  let reconnectTimer: ReturnType<typeof setTimeout> | null = null
+
+  const scheduleReconnect = () => {
+    if (manualClose || reconnectTimer) return
+    reconnectTimer = setTimeout(() => {
+      reconnectTimer = null
+      connect()
+    }, reconnectDelay)
+    reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY)
+  }
 
   const connect = () => {
     if (ws.value?.readyState === WebSocket.OPEN) return
+    manualClose = false
 
     const roomId = room.value || 'general'
-    ws.value = new WebSocket(`${WS_URL}/${roomId}`)
+    const seq = lastSeq?.() || 0
+    const query = seq > 0 ? `?last_seq=${seq}` : ''
+    ws.value = new WebSocket(`${WS_URL}/${roomId}${query}`)
 
     ws.value.onopen = () => {
+      reconnectDelay = 500
       listeners.value.get('open')?.forEach(cb => cb(null))
     }
 
@@ -34,10 +53,16 @@ export function useWebSocket(room: Ref<string>) {
 
     ws.value.onclose = () => {
       listeners.value.get('close')?.forEach(cb => cb(null))
+      scheduleReconnect()
     }
   }
 
   const disconnect = () => {
+    manualClose = true
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer)
+      reconnectTimer = null
+    }
     ws.value?.close()
     ws.value = null
   }
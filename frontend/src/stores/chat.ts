@@ -11,6 +11,7 @@ interface Message {
   room_id?: string
   command_result?: string | null
   error_message?: string | null
+  seq?: number | null
   created_at?: string
   author?: {
     id: number
@@ -40,47 +41,63 @@ export const useChatStore = defineStore('chat', () => {
   const connected = ref(false)
   const loadingHistory = ref(false)
   const currentUser = ref<{ id: number; username: string } | null>(null)
+  // 已收到的最大序号，断线重连时据此让服务端补发，无需重新拉取历史
+  const lastSeq = ref(0)
 
-  const ws = useWebSocket(room)
+  const ws = useWebSocket(room, () => lastSeq.value)
 
-  const connect = () => {
-    ws.connect()
+  const trackSeq = (seq?: number | null) => {
+    if (seq && seq > lastSeq.value) lastSeq.value = seq
+  }
 
-    ws.on('message', (eventData: { type: string; data: Message }) => {
-      const data = eventData.data
-      if (data && data.content) {
-        // 检查是否已存在 id 为 -1 的临时消息（我们发送的消息）
-        const existingIndex = messages.value.findIndex(
-          m => m.id === -1 && m.content === data.content
-        )
-
-        if (existingIndex !== -1) {
-          // 更新临时消息为 confirmed 消息
-          messages.value[existingIndex] = {
-            ...messages.value[existingIndex],
-            id: data.id,
-            author_id: data.author_id,
-            created_at: data.created_at,
+  const applyMessage = (data: Message) => {
+    trackSeq(data?.seq)
+    if (data && data.content) {
+      // 检查是否已存在 id 为 -1 的临时消息（我们发送的消息）
+      const existingIndex = messages.value.findIndex(
+        m => m.id === -1 && m.content === data.content
+      )
+
+      if (existingIndex !== -1) {
+        // 更新临时消息为 confirmed 消息
+        messages.value[existingIndex] = {
+          ...messages.value[existingIndex],
+          id: data.id,
+          author_id: data.author_id,
+          created_at: data.created_at,
+          command_result: data.command_result,
+          error_message: data.error_message
+        }
+      } else {
+        // 查找是否已存在相同 id 的消息（命令结果更新）
+        const foundIndex = messages.value.findIndex(m => m.id === data.id)
+        if (foundIndex !== -1) {
+          // 更新现有消息（命令结果更新）
+          messages.value[foundIndex] = {
+            ...messages.value[foundIndex],
             command_result: data.command_result,
-            error_message: data.error_message
+            error_message: data.error_message,
+            seq: data.seq
           }
         } else {
-          // 查找是否已存在相同 id 的消息（命令结果更新）
-          const foundIndex = messages.value.findIndex(m => m.id === data.id)
-          if (foundIndex !== -1) {
-            // 更新现有消息（命令结果更新）
-            messages.value[foundIndex] = {
-              ...messages.value[foundIndex],
-              command_result: data.command_result,
-              error_message: data.error_message
-            }
-          } else {
-            // 新消息，直接添加
-            messages.value.push(data)
-          }
+          // 新消息，直接添加
+          messages.value.push(data)
         }
-        scrollToBottom()
       }
+      scrollToBottom()
+    }
+  }
+
+  const connect = () => {
+    ws.connect()
+
+    ws.on('message', (eventData: { type: string; data: Message }) => {
+      applyMessage(eventData.data)
+    })
+
+    // 批量接口写入的消息按房间合并成一帧下发
+    ws.on('message_batch', (eventData: { type: string; data: Message[] }) => {
+      eventData.data.forEach(applyMessage)
     })
 
     ws.on('error', (data: any) => {
@@ -89,7 +106,13 @@ export const useChatStore = defineStore('chat', () => {
 
     ws.on('open', () => {
       connected.value = true
-      loadHistory()
+      // 首次连接加载历史；重连时由服务端按 last_seq 补发
+      if (!lastSeq.value) loadHistory()
+    })
+
+    ws.on('replay_done', (data: { truncated: boolean }) => {
+      // 缺失太多时服务端只补发了一部分，退回到完整加载历史
+      if (data.truncated) loadHistory()
     })
 
     ws.on('close', () => {
@@ -156,6 +179,7 @@ export const useChatStore = defineStore('chat', () => {
     try {
       const history = await getMessages(room.value, 100)
       messages.value = history
+      history.forEach((m: Message) => trackSeq(m.seq))
       scrollToBottom()
     } catch (error) {
       console.error('Failed to load message history:', error)